@@ -0,0 +1,136 @@
+"""
+Measure the bytes sent on the wire and the latency of UpdateRelease calls
+carrying large charts, with and without gRPC compression.
+
+Calls go through a TCP proxy counting the bytes sent to an in-process
+tiller, which can also throttle them to stand for a slow port-forward:
+
+    python benchmarks/bench_compression.py --chart-size 4194304 --bandwidth 1048576
+"""
+import argparse
+import random
+import socket
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+from common import make_chart
+
+from hapi.services.tiller_pb2 import UpdateReleaseResponse
+from hapi.services.tiller_pb2_grpc import ReleaseServiceServicer, \
+    add_ReleaseServiceServicer_to_server
+from pyhelm.tiller import Tiller, GRPC_CHANNEL_OPTIONS
+
+CHUNK_SIZE = 16 * 1024
+
+
+def vary(chart, seed=0):
+    """
+    Make every template line of a synthetic chart unique, so that it
+    compresses about as well as real-world templates rather than as a
+    repeated block
+    """
+    rng = random.Random(seed)
+    for template in chart.templates:
+        template.data = b'\n'.join(
+            line + b'  # checksum/config: %08x' % rng.getrandbits(32) if line else line
+            for line in template.data.split(b'\n'))
+    return chart
+
+
+class UpdateServicer(ReleaseServiceServicer):
+
+    def UpdateRelease(self, request, context):
+        return UpdateReleaseResponse()
+
+
+class CountingProxy(object):
+    """
+    Forward TCP connections to `target_port`, counting the bytes sent
+    upstream and throttling them to `bandwidth` bytes per second if set
+    """
+
+    def __init__(self, target_port, bandwidth=None):
+        self.target_port = target_port
+        self.bandwidth = bandwidth
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(8)
+        self.port = self._listener.getsockname()[1]
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            client, _ = self._listener.accept()
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for source, sink, count in ((client, upstream, True), (upstream, client, False)):
+                thread = threading.Thread(target=self._pipe, args=(source, sink, count))
+                thread.daemon = True
+                thread.start()
+
+    def _pipe(self, source, sink, count):
+        try:
+            while True:
+                data = source.recv(CHUNK_SIZE)
+                if not data:
+                    break
+                if count:
+                    with self._lock:
+                        self.sent += len(data)
+                    if self.bandwidth:
+                        time.sleep(float(len(data)) / self.bandwidth)
+                sink.sendall(data)
+        except socket.error:
+            pass
+        finally:
+            sink.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chart-size', type=int, default=4 * 1024 * 1024,
+                        help='approximate size of the chart templates, in bytes')
+    parser.add_argument('--calls', type=int, default=5)
+    parser.add_argument('--bandwidth', type=int, default=None,
+                        help='upstream bandwidth of the proxy, in bytes per second')
+    args = parser.parse_args()
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4),
+                         options=GRPC_CHANNEL_OPTIONS)
+    add_ReleaseServiceServicer_to_server(UpdateServicer(), server)
+    server_port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+
+    chart = vary(make_chart(size=args.chart_size))
+    print('chart: %d bytes serialized' % chart.ByteSize())
+    print('%-8s %12s %8s %12s' % ('mode', 'wire bytes', 'ratio', 'latency (s)'))
+
+    baseline = None
+    for compression in (None, 'gzip', 'deflate'):
+        proxy = CountingProxy(server_port, args.bandwidth)
+        tiller = Tiller('127.0.0.1', port=proxy.port, compression=compression)
+        # The first call also sets up the connection
+        tiller.update_release(chart, 'default', name='app')
+
+        sent = proxy.sent
+        start = time.time()
+        for _ in range(args.calls):
+            tiller.update_release(chart, 'default', name='app')
+        latency = (time.time() - start) / args.calls
+        wire_bytes = (proxy.sent - sent) // args.calls
+
+        baseline = baseline or wire_bytes
+        print('%-8s %12d %7.1fx %12.3f' % (compression or 'none', wire_bytes,
+                                           float(baseline) / wire_bytes, latency))
+
+    server.stop(None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Compare a sequential release listing with a partitioned parallel one,
+against a FakeTiller adding a fixed latency to every page to stand for
+the round trip to a remote tiller:
+
+    python benchmarks/bench_parallel_listing.py --releases 5000 --latency 0.02
+"""
+import argparse
+import time
+
+from common import make_release
+
+from pyhelm.testing import FakeTiller
+
+APPS = ('api', 'billing', 'cache', 'dashboard', 'etl', 'frontend', 'gateway',
+        'hub', 'ingest', 'jobs', 'kafka', 'ledger', 'mail', 'nginx', 'orders',
+        'payments', 'queue', 'redis', 'search', 'tracing', 'users', 'vault',
+        'web', 'xds', 'yarn', 'zookeeper')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--releases', type=int, default=2000)
+    parser.add_argument('--namespaces', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds added to every page')
+    parser.add_argument('--limit', type=int, default=32, help='releases per page')
+    args = parser.parse_args()
+
+    releases = []
+    for i in range(args.releases):
+        release = make_release(i, namespace='team-%d' % (i % args.namespaces), chart_size=1024)
+        release.name = '%s-%05d' % (APPS[i % len(APPS)], i)
+        releases.append(release)
+
+    fake = FakeTiller(latency=args.latency, releases=releases, max_workers=32).start()
+    tiller = fake.tiller()
+    namespaces = ['team-%d' % i for i in range(args.namespaces)]
+    modes = (
+        ('sequential', lambda: tiller.list_releases(limit=args.limit)),
+        ('by name', lambda: tiller.list_releases_parallel(limit=args.limit)),
+        ('by namespace', lambda: tiller.list_releases_parallel(namespaces=namespaces,
+                                                               limit=args.limit)),
+    )
+
+    print('%-14s %9s %9s %8s' % ('mode', 'releases', 'seconds', 'speedup'))
+    baseline = None
+    for mode, list_releases in modes:
+        start = time.time()
+        count = len(list_releases())
+        seconds = time.time() - start
+        baseline = baseline or seconds
+        print('%-14s %9d %9.2f %7.1fx' % (mode, count, seconds, baseline / seconds))
+
+    fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Compare the memory kept alive by a full release listing with a
+ReleaseSummary listing, both made by Tiller.iter_releases against a
+FakeTiller serving a synthetic inventory.
+
+Each mode lists in its own process so its peak RSS can be measured
+independently:
+
+    python benchmarks/bench_release_summary.py --releases 5000
+"""
+import argparse
+import multiprocessing
+
+from common import make_release, peak_rss_kb
+
+from pyhelm.testing import FakeTiller
+from pyhelm.tiller import Tiller, RELEASE_LIMIT
+
+
+def run(mode, port, page_size, queue):
+    tiller = Tiller('localhost', port=port)
+    # Leave the channel setup out of the measure
+    tiller.wait_ready()
+    baseline = peak_rss_kb()
+
+    inventory = list(tiller.iter_releases(limit=page_size, summary=mode == 'summary'))
+
+    queue.put((len(inventory), peak_rss_kb() - baseline))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--releases', type=int, default=5000)
+    parser.add_argument('--page-size', type=int, default=RELEASE_LIMIT)
+    args = parser.parse_args()
+
+    fake = FakeTiller(releases=[make_release(i) for i in range(args.releases)]).start()
+
+    # The parent already uses gRPC, so don't fork the listing processes
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for mode in ('full', 'summary'):
+        queue = context.Queue()
+        process = context.Process(target=run, args=(mode, fake.port, args.page_size, queue))
+        process.start()
+        results[mode] = queue.get()
+        process.join()
+        print('%-8s %6d releases  peak RSS growth %8d KB' % ((mode,) + results[mode]))
+
+    fake.stop()
+
+    if results['summary'][1]:
+        print('reduction: %.1fx' % (float(results['full'][1]) / results['summary'][1]))
+
+
+if __name__ == '__main__':
+    main()
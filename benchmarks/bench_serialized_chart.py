@@ -0,0 +1,60 @@
+"""
+Compare the client CPU time spent deploying the same large chart many
+times as a Chart message, re-encoded into every request, and as a
+SerializedChart, encoded once and spliced into every request:
+
+    python benchmarks/bench_serialized_chart.py --chart-size 10485760 --installs 100
+
+The in-process tiller doesn't decode the requests, so the CPU time
+measured is mostly the client's.
+"""
+import argparse
+import time
+from concurrent import futures
+
+import grpc
+
+from common import make_chart
+
+from hapi.services.tiller_pb2 import InstallReleaseResponse
+from pyhelm.tiller import Tiller, SerializedChart, GRPC_CHANNEL_OPTIONS
+
+
+def install_release(request, context):
+    return InstallReleaseResponse().SerializeToString()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chart-size', type=int, default=10 * 1024 * 1024,
+                        help='size of the chart templates, in bytes')
+    parser.add_argument('--installs', type=int, default=100)
+    args = parser.parse_args()
+
+    # Requests and responses are left as bytes on the server side
+    handler = grpc.method_handlers_generic_handler('hapi.services.tiller.ReleaseService', {
+        'InstallRelease': grpc.unary_unary_rpc_method_handler(install_release),
+    })
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4),
+                         options=GRPC_CHANNEL_OPTIONS)
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+
+    tiller = Tiller('127.0.0.1', port=port)
+    chart = make_chart(size=args.chart_size)
+    print('chart: %d bytes serialized, %d installs' % (chart.ByteSize(), args.installs))
+    print('%-12s %10s %10s' % ('mode', 'cpu (s)', 'wall (s)'))
+
+    for mode in ('chart', 'serialized'):
+        cpu, wall = time.process_time(), time.time()
+        deployed = chart if mode == 'chart' else SerializedChart(chart)
+        for i in range(args.installs):
+            tiller.install_release(deployed, 'ns-%d' % i, name='app-%d' % i)
+        print('%-12s %10.2f %10.2f' % (mode, time.process_time() - cpu, time.time() - wall))
+
+    server.stop(None)
+
+
+if __name__ == '__main__':
+    main()
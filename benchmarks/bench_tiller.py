@@ -0,0 +1,180 @@
+"""
+Throughput and latency of the Tiller client against a FakeTiller.
+
+Measures list_releases at 100/1k/10k releases, install_release and
+update_release with 1MB/10MB charts, and get_release_status polled from
+1 to 256 threads. Every scenario runs in its own process, and reports
+ops/s, p50/p99 latency and peak RSS (client and fake tiller together).
+
+Results can be saved as JSON and compared with a previous run:
+
+    python benchmarks/bench_tiller.py --output before.json
+    python benchmarks/bench_tiller.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import sys
+import threading
+import time
+
+from common import make_chart, make_release, peak_rss_kb
+
+from pyhelm.testing import FakeTiller
+
+LIST_SIZES = (100, 1000, 10000)
+CHART_SIZES = (1024 * 1024, 10 * 1024 * 1024)
+POLLING_THREADS = (1, 4, 16, 64, 256)
+
+
+def timed(operation, samples):
+    start = time.time()
+    operation()
+    samples.append(time.time() - start)
+
+
+def list_releases(releases, quick):
+    fake = FakeTiller(releases=[make_release(i, chart_size=1024) for i in range(releases)]).start()
+    tiller = fake.tiller()
+    samples = []
+    for _ in range(2 if quick else 5):
+        timed(tiller.list_releases, samples)
+    fake.stop()
+    return samples
+
+
+def install_release(chart_size, quick):
+    fake = FakeTiller().start()
+    tiller = fake.tiller()
+    chart = make_chart(size=chart_size)
+    samples = []
+    for i in range(3 if quick else 10):
+        timed(lambda: tiller.install_release(chart, 'default', name='app-%d' % i), samples)
+    fake.stop()
+    return samples
+
+
+def update_release(chart_size, quick):
+    fake = FakeTiller().start()
+    tiller = fake.tiller()
+    chart = make_chart(size=chart_size)
+    tiller.install_release(chart, 'default', name='app')
+    samples = []
+    for i in range(3 if quick else 10):
+        timed(lambda: tiller.update_release(chart, 'default', name='app', values={'i': i}), samples)
+    fake.stop()
+    return samples
+
+
+def poll_status(threads, quick):
+    names = ['release-%05d' % i for i in range(100)]
+    fake = FakeTiller(releases=[make_release(i, chart_size=1024) for i in range(len(names))]).start()
+    tiller = fake.tiller()
+    calls = max(10 if quick else 50, (200 if quick else 1000) // threads)
+    samples = []
+    lock = threading.Lock()
+
+    def poll():
+        thread_samples = []
+        for _ in range(calls):
+            timed(lambda: tiller.get_release_status(random.choice(names)), thread_samples)
+        with lock:
+            samples.extend(thread_samples)
+
+    workers = [threading.Thread(target=poll) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    fake.stop()
+    return samples
+
+
+SCENARIOS = (
+    [('list_releases/%d' % size, list_releases, size) for size in LIST_SIZES] +
+    [('install_release/%dMB' % (size // (1024 * 1024)), install_release, size) for size in CHART_SIZES] +
+    [('update_release/%dMB' % (size // (1024 * 1024)), update_release, size) for size in CHART_SIZES] +
+    [('get_release_status/%dthreads' % threads, poll_status, threads) for threads in POLLING_THREADS]
+)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[int(round(fraction * (len(ordered) - 1)))]
+
+
+def run(name, scenario, argument, quick, queue):
+    start = time.time()
+    samples = scenario(argument, quick)
+    seconds = time.time() - start
+    queue.put({
+        'name': name,
+        'ops': len(samples),
+        'seconds': seconds,
+        'ops_per_s': len(samples) / seconds,
+        'p50_ms': percentile(samples, 0.5) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'peak_rss_kb': peak_rss_kb(),
+    })
+
+
+def compare(results, baseline):
+    previous = dict((result['name'], result) for result in baseline['results'])
+    print('\n%-32s %12s %12s %12s' % ('compared to baseline', 'ops/s', 'p99', 'peak RSS'))
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None:
+            continue
+        print('%-32s %+11.1f%% %+11.1f%% %+11.1f%%' % (
+            result['name'],
+            100.0 * (result['ops_per_s'] / before['ops_per_s'] - 1),
+            100.0 * (result['p99_ms'] / before['p99_ms'] - 1),
+            100.0 * (float(result['peak_rss_kb']) / before['peak_rss_kb'] - 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', default='',
+                        help='only run the scenarios whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='run fewer operations')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results of this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    print('%-32s %8s %10s %10s %10s %12s' % ('scenario', 'ops', 'ops/s', 'p50 (ms)',
+                                              'p99 (ms)', 'peak RSS KB'))
+    for name, scenario, argument in SCENARIOS:
+        if args.scenarios not in name:
+            continue
+
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run, args=(name, scenario, argument,
+                                                            args.quick, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        results.append(result)
+        print('%-32s %8d %10.1f %10.2f %10.2f %12d' % (
+            name, result['ops'], result['ops_per_s'], result['p50_ms'],
+            result['p99_ms'], result['peak_rss_kb']))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'timestamp': time.time(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'quick': args.quick,
+                'results': results,
+            }, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
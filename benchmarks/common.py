@@ -0,0 +1,62 @@
+"""
+Helpers shared by the pyhelm benchmarks
+"""
+import os
+import resource
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.config_pb2 import Config
+from hapi.chart.metadata_pb2 import Metadata
+from hapi.chart.template_pb2 import Template
+from hapi.release.info_pb2 import Info
+from hapi.release.release_pb2 import Release
+from hapi.release.status_pb2 import Status
+from google.protobuf.any_pb2 import Any
+
+TEMPLATE = b'''apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: {{ include "app.fullname" . }}
+  labels:
+    app: {{ .Chart.Name }}
+spec:
+  replicas: {{ .Values.replicas }}
+'''
+
+
+def make_chart(name='app', version='1.0.0', size=16 * 1024):
+    """
+    Build a synthetic chart whose templates add up to roughly `size` bytes
+    """
+    count = max(1, size // 4096)
+    data = (TEMPLATE * (4096 // len(TEMPLATE) + 1))[:4096]
+    return Chart(
+        metadata=Metadata(name=name, version=version, apiVersion='v1'),
+        templates=[Template(name='templates/t%d.yaml' % i, data=data) for i in range(count)],
+        values=Config(raw='replicas: 1\n'),
+        files=[Any(type_url='README.md', value=b'readme')],
+    )
+
+
+def make_release(index, namespace='default', chart_size=16 * 1024):
+    """
+    Build a synthetic deployed release carrying a chart and a manifest
+    """
+    chart = make_chart(name='app%d' % (index % 50), size=chart_size)
+    info = Info(status=Status(code=Status.DEPLOYED), Description='Install complete')
+    info.first_deployed.seconds = 1500000000 + index
+    info.last_deployed.seconds = 1500000000 + index
+    return Release(name='release-%05d' % index, namespace=namespace, version=1,
+                   info=info, chart=chart, config=Config(raw='replicas: 2\n'),
+                   manifest=b''.join(t.data for t in chart.templates).decode('utf-8'))
+
+
+def peak_rss_kb():
+    """
+    Peak resident set size of this process, in KB
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
@@ -0,0 +1,306 @@
+# Python 3.6+ only: grpc.aio and async generators aren't available on python 2
+
+import grpc
+import grpc.aio
+import yaml
+import pyhelm.logger as logger
+
+from hapi.services.tiller_pb2 import ListReleasesRequest, \
+    InstallReleaseRequest, UpdateReleaseRequest, UninstallReleaseRequest, \
+    GetReleaseStatusRequest, GetReleaseContentRequest, GetHistoryRequest, \
+    RollbackReleaseRequest, TestReleaseRequest
+from hapi.services.tiller_pb2_grpc import ReleaseServiceStub
+from hapi.chart.config_pb2 import Config
+from pyhelm.tiller import TILLER_PORT, TILLER_VERSION, TILLER_TIMEOUT, \
+    RELEASE_LIMIT, DEFAULT_NAMESPACE, GRPC_CHANNEL_OPTIONS, \
+    ReleaseSummary, status_code_numbers, list_sort_number, release_not_found, \
+    compression_algorithm
+
+
+class AsyncTiller(object):
+    """
+    The AsyncTiller class mirrors Tiller on top of a grpc.aio channel, so a
+    single event loop can drive many concurrent release operations
+    """
+
+    _logger = logger.get_logger('AsyncTiller')
+
+    def __init__(self, host, port=TILLER_PORT, timeout=TILLER_TIMEOUT, tls_config=None,
+                 compression=None):
+        # init k8s connectivity
+        self._host = host
+        self._port = port
+        self._tls_config = tls_config
+
+        # optional compression ("gzip" or "deflate") of all the requests
+        self._compression = compression_algorithm(compression)
+
+        # init tiller channel, a single stub is shared by all the coroutines
+        self._channel = self.get_channel()
+        self._stub = ReleaseServiceStub(self._channel)
+
+        # init timeout for all requests
+        self._timeout = timeout
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def metadata(self):
+        """
+        Return tiller metadata for requests
+        """
+        return [(b'x-helm-api-client', TILLER_VERSION)]
+
+    def get_channel(self):
+        """
+        Return an asyncio tiller channel
+        """
+
+        target = '%s:%s' % (self._host, self._port)
+
+        if self._tls_config:
+            ssl_channel_credentials = grpc.ssl_channel_credentials(
+                root_certificates=self._tls_config.ca_data,
+                private_key=self._tls_config.key_data,
+                certificate_chain=self._tls_config.cert_data
+            )
+
+            return grpc.aio.secure_channel(target, ssl_channel_credentials,
+                                           options=GRPC_CHANNEL_OPTIONS,
+                                           compression=self._compression)
+        else:
+            return grpc.aio.insecure_channel(target, options=GRPC_CHANNEL_OPTIONS,
+                                             compression=self._compression)
+
+    async def close(self):
+        """
+        Close the underlying channel, cancelling in-flight calls
+        """
+        await self._channel.close()
+
+    def tiller_status(self):
+        """
+        return if tiller exist or not
+        """
+        if self._host:
+            return True
+
+        return False
+
+    async def list_releases(self, status_codes=None, namespace="", filter="",
+                            sort_by=None, sort_order=None, limit=RELEASE_LIMIT,
+                            summary=False):
+        """
+        List Helm Releases
+
+        Possible status codes can be seen in the status_pb2 in part of Helm gRPC definition
+        """
+        return [release async for release in self.iter_releases(status_codes=status_codes,
+                                                                namespace=namespace,
+                                                                filter=filter,
+                                                                sort_by=sort_by,
+                                                                sort_order=sort_order,
+                                                                limit=limit,
+                                                                summary=summary)]
+
+    async def iter_releases(self, status_codes=None, namespace="", filter="",
+                            sort_by=None, sort_order=None, limit=RELEASE_LIMIT,
+                            summary=False):
+        """
+        Lazily iterate over Helm Releases, one page at a time
+
+        See Tiller.iter_releases for the filtering and sorting options
+        """
+        request_status_codes = status_code_numbers(status_codes)
+        request_sort_by = list_sort_number("SortBy", sort_by)
+        request_sort_order = list_sort_number("SortOrder", sort_order)
+        offset = None
+
+        while True:
+            req = ListReleasesRequest(limit=limit,
+                                      offset=offset,
+                                      namespace=namespace,
+                                      status_codes=request_status_codes,
+                                      filter=filter,
+                                      sort_by=request_sort_by,
+                                      sort_order=request_sort_order)
+            release_list = self._stub.ListReleases(req, timeout=self._timeout,
+                                                   metadata=self.metadata)
+
+            async for page in release_list:
+                offset = str(page.next)
+
+                if summary:
+                    releases = [ReleaseSummary.from_release(r) for r in page.releases]
+                else:
+                    releases = page.releases
+                del page
+
+                for release in releases:
+                    yield release
+
+            # See Tiller.iter_releases for the two cases handled here
+            if not offset:
+                break
+
+    async def list_charts(self):
+        """
+        List Helm Charts from Latest Releases
+
+        Returns list of (name, version, chart, values)
+        """
+        return [(release.name, release.version, release.chart, release.config.raw)
+                for release in await self.list_releases()]
+
+    async def update_release(self, chart, namespace, dry_run=False,
+                             name=None, values=None, wait=False,
+                             disable_hooks=False, recreate=False,
+                             reset_values=False, reuse_values=False,
+                             force=False, description="", install=False):
+        """
+        Update a Helm Release
+        """
+        if install:
+            if not namespace:
+                namespace = DEFAULT_NAMESPACE
+
+            try:
+                release_status = await self.get_release_status(name)
+            except grpc.RpcError as rpc_error_call:
+                if not release_not_found(rpc_error_call, name):
+                    raise rpc_error_call
+
+                # The release doesn't exist - it's time to install
+                self._logger.info(
+                    "Release %s does not exist. Installing it now.", name)
+
+                return await self.install_release(chart, namespace, dry_run,
+                                                  name, values, wait)
+
+            if release_status.namespace != namespace:
+                self._logger.warn("Namespace %s doesn't match with previous. Release will be deployed to %s",
+                                  release_status.namespace, namespace)
+
+        values = Config(raw=yaml.safe_dump(values or {}))
+
+        release_request = UpdateReleaseRequest(
+            chart=chart,
+            dry_run=dry_run,
+            disable_hooks=disable_hooks,
+            values=values,
+            name=name or '',
+            wait=wait,
+            recreate=recreate,
+            reset_values=reset_values,
+            reuse_values=reuse_values,
+            force=force,
+            description=description)
+
+        return await self._stub.UpdateRelease(release_request,
+                                              timeout=self._timeout,
+                                              metadata=self.metadata)
+
+    async def install_release(self, chart, namespace, dry_run=False,
+                              name=None, values=None, wait=False,
+                              disable_hooks=False, reuse_name=False,
+                              disable_crd_hook=False, description=""):
+        """
+        Create a Helm Release
+        """
+
+        values = Config(raw=yaml.safe_dump(values or {}))
+
+        release_request = InstallReleaseRequest(
+            chart=chart,
+            dry_run=dry_run,
+            values=values,
+            name=name or '',
+            namespace=namespace,
+            wait=wait,
+            disable_hooks=disable_hooks,
+            reuse_name=reuse_name,
+            disable_crd_hook=disable_crd_hook,
+            description=description)
+
+        return await self._stub.InstallRelease(release_request,
+                                               timeout=self._timeout,
+                                               metadata=self.metadata)
+
+    async def uninstall_release(self, release, disable_hooks=False, purge=True):
+        """
+        :params - release - helm chart release name
+        :params - purge - deep delete of chart
+
+        Deletes a helm chart from tiller
+        """
+        release_request = UninstallReleaseRequest(name=release,
+                                                  disable_hooks=disable_hooks,
+                                                  purge=purge)
+        return await self._stub.UninstallRelease(release_request,
+                                                 timeout=self._timeout,
+                                                 metadata=self.metadata)
+
+    async def get_release_status(self, release, version=None):
+        """
+        Gets a release's status
+        """
+        status_request = GetReleaseStatusRequest(name=release,
+                                                 version=version)
+        return await self._stub.GetReleaseStatus(status_request,
+                                                 timeout=self._timeout,
+                                                 metadata=self.metadata)
+
+    async def get_release_content(self, release, version=None):
+        """
+        Gets a release's content
+        """
+        status_request = GetReleaseContentRequest(name=release,
+                                                  version=version)
+        return await self._stub.GetReleaseContent(status_request,
+                                                  timeout=self._timeout,
+                                                  metadata=self.metadata)
+
+    async def get_history(self, release, max=256):
+        """
+        Gets a release's history, newest revision first
+        """
+        history_request = GetHistoryRequest(name=release, max=max)
+        return await self._stub.GetHistory(history_request,
+                                           timeout=self._timeout,
+                                           metadata=self.metadata)
+
+    async def rollback_release(self, release, version, dry_run=False,
+                               disable_hooks=False, recreate=False, wait=False,
+                               force=False, description=""):
+        """
+        Roll a Helm Release back to a previous revision
+        """
+        rollback_request = RollbackReleaseRequest(name=release,
+                                                  version=version,
+                                                  dry_run=dry_run,
+                                                  disable_hooks=disable_hooks,
+                                                  recreate=recreate,
+                                                  wait=wait,
+                                                  force=force,
+                                                  description=description)
+        return await self._stub.RollbackRelease(rollback_request,
+                                                timeout=self._timeout,
+                                                metadata=self.metadata)
+
+    async def test_release(self, release, cleanup=False, parallel=False):
+        """
+        Run a release's test hooks
+
+        Returns the list of test messages streamed back by tiller
+        """
+        test_request = TestReleaseRequest(name=release,
+                                          timeout=self._timeout,
+                                          cleanup=cleanup,
+                                          parallel=parallel)
+        return [msg async for msg in self._stub.RunReleaseTest(test_request,
+                                                               timeout=self._timeout,
+                                                               metadata=self.metadata)]
@@ -11,6 +11,7 @@ from hapi.chart.config_pb2 import Config
 from google.protobuf.any_pb2 import Any
 
 from pyhelm import repo
+from pyhelm.tiller import PayloadReport
 from collections import defaultdict
 from supermutes.dot import dotify
 
@@ -256,3 +257,10 @@ class ChartBuilder(object):
         It should recurse into dependencies
         '''
         return self.get_helm_chart().SerializeToString()
+
+    def payload_report(self):
+        '''
+        Return a PayloadReport breaking the serialized size of the chart
+        down per file and per dependency
+        '''
+        return PayloadReport(self.get_helm_chart())
@@ -0,0 +1,130 @@
+import threading
+import time
+from concurrent import futures
+import pyhelm.logger as logger
+
+from pyhelm.tiller import Tiller
+
+FLEET_MAX_WORKERS = 16
+
+
+class ClusterResult(object):
+    """
+    The outcome of an operation run on one cluster of a TillerFleet
+    """
+
+    def __init__(self, cluster, response=None, error=None, seconds=0):
+        self.cluster = cluster
+        self.response = response
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<ClusterResult %s %s in %.3fs>' % (
+            self.cluster, 'ok' if self.ok else 'failed: %s' % self.error, self.seconds)
+
+
+class TillerFleet(object):
+    """
+    Run the same read operation on the Tillers of many clusters concurrently,
+    so that a fleet-wide query takes about as long as the slowest cluster.
+
+    `tillers` maps cluster names to Tiller instances, or to the host (or list
+    of endpoints) of a Tiller built with `tiller_kwargs`. At most
+    `max_workers` calls are in flight across the whole fleet, however many
+    operations run at once.
+    """
+
+    _logger = logger.get_logger('TillerFleet')
+
+    def __init__(self, tillers, max_workers=FLEET_MAX_WORKERS, **tiller_kwargs):
+        self.tillers = dict(
+            (cluster, tiller if isinstance(tiller, Tiller) else Tiller(tiller, **tiller_kwargs))
+            for cluster, tiller in tillers.items())
+        # The Tillers built from hosts, which the fleet closes
+        self._built = [self.tillers[cluster] for cluster, tiller in tillers.items()
+                       if not isinstance(tiller, Tiller)]
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self.latency = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stop the fleet's workers, waiting for in-flight calls, and close the
+        Tillers it built
+        """
+        self._executor.shutdown(wait=True)
+        for tiller in self._built:
+            tiller.close()
+
+    def run(self, operation, *args, **kwargs):
+        """
+        :params - operation - name of a Tiller method (e.g. "list_releases"),
+                              or a callable taking the Tiller of a cluster
+        :params - clusters - only run on these clusters, defaults to all of them
+
+        Run an operation on every cluster, passing it the other arguments.
+
+        Yields a ClusterResult per cluster as soon as it finishes. Failures
+        don't stop the other clusters, they are reported in their result.
+        """
+        clusters = kwargs.pop('clusters', None) or sorted(self.tillers)
+
+        def call(cluster):
+            tiller = self.tillers[cluster]
+            start = time.time()
+            try:
+                if callable(operation):
+                    response = operation(tiller, *args, **kwargs)
+                else:
+                    response = getattr(tiller, operation)(*args, **kwargs)
+            except Exception as error:
+                return ClusterResult(cluster, error=error, seconds=time.time() - start)
+            return ClusterResult(cluster, response=response, seconds=time.time() - start)
+
+        pending = [self._executor.submit(call, cluster) for cluster in clusters]
+        for future in futures.as_completed(pending):
+            result = future.result()
+            with self._lock:
+                self.latency[result.cluster] = result.seconds
+            if not result.ok:
+                self._logger.error("%s failed on cluster %s: %s",
+                                   getattr(operation, '__name__', operation),
+                                   result.cluster, result.error)
+            yield result
+
+    def gather(self, operation, *args, **kwargs):
+        """
+        Run an operation on every cluster, returning their ClusterResults by cluster
+        """
+        return dict((result.cluster, result)
+                    for result in self.run(operation, *args, **kwargs))
+
+    def iter_releases(self, **kwargs):
+        """
+        Yield (cluster, release) tuples, cluster by cluster as their listings
+        complete. Takes the arguments of Tiller.list_releases.
+
+        Clusters failing to list their releases are logged and skipped; use
+        run("list_releases") to handle their errors.
+        """
+        for result in self.run('list_releases', **kwargs):
+            if result.ok:
+                for release in result.response:
+                    yield result.cluster, release
+
+    def list_releases(self, **kwargs):
+        """
+        List the releases of the whole fleet as (cluster, release) tuples
+        """
+        return list(self.iter_releases(**kwargs))
@@ -0,0 +1,459 @@
+import collections
+import random
+import threading
+import time
+import grpc
+import pyhelm.logger as logger
+
+READ_METHODS = ('ListReleases', 'GetReleaseStatus', 'GetReleaseContent',
+                'GetHistory', 'GetVersion')
+WRITE_METHODS = ('InstallRelease', 'UpdateRelease', 'UninstallRelease',
+                 'RollbackRelease', 'RunReleaseTest')
+RETRYABLE_STATUS_CODES = (grpc.StatusCode.UNAVAILABLE,)
+CACHE_TTL = 10
+CACHE_MAX_ENTRIES = 1024
+
+
+def method_name(client_call_details):
+    """
+    Return the short RPC name (e.g. "ListReleases") of a call
+    """
+    method = client_call_details.method
+    if isinstance(method, bytes):
+        method = method.decode('utf-8')
+    return method.rsplit('/', 1)[-1]
+
+
+class CompletedCall(grpc.Call, grpc.Future):
+    """
+    A call that already finished, used by interceptors that answer a request
+    without (or after) going to tiller.
+
+    For unary calls `response` is the response message; for server-streaming
+    calls it is the list of responses, which the call iterates over.
+    """
+
+    def __init__(self, response=None, code=grpc.StatusCode.OK, details=None,
+                 exception=None):
+        self._response = response
+        self._code = code
+        self._details = details
+        self._exception = exception
+        self._iterator = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            if self._exception is not None:
+                raise self._exception
+            self._iterator = iter(self._response)
+        return next(self._iterator)
+
+    next = __next__
+
+    def result(self, timeout=None):
+        if self._exception is not None:
+            raise self._exception
+        return self._response
+
+    def exception(self, timeout=None):
+        return self._exception
+
+    def traceback(self, timeout=None):
+        return None
+
+    def add_done_callback(self, fn):
+        fn(self)
+
+    def cancel(self):
+        return False
+
+    def cancelled(self):
+        return False
+
+    def running(self):
+        return False
+
+    def done(self):
+        return True
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+    def initial_metadata(self):
+        return None
+
+    def trailing_metadata(self):
+        return None
+
+    def is_active(self):
+        return False
+
+    def time_remaining(self):
+        return None
+
+    def add_callback(self, callback):
+        return False
+
+
+class StreamingCall(object):
+    """
+    Wrap a server-streaming call, running `on_response(response)` for every
+    response and `on_done(error)` once the stream is exhausted or fails.
+    Other attributes are forwarded to the call.
+    """
+
+    def __init__(self, call, on_done, on_response=None):
+        self._call = call
+        self._on_done = on_done
+        self._on_response = on_response
+        self._finished = False
+
+    def __getattr__(self, name):
+        return getattr(self._call, name)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            response = next(self._call)
+        except StopIteration:
+            self._finish(None)
+            raise
+        except grpc.RpcError as rpc_error:
+            self._finish(rpc_error)
+            raise
+
+        if self._on_response is not None:
+            self._on_response(response)
+        return response
+
+    next = __next__
+
+    def _finish(self, error):
+        if not self._finished:
+            self._finished = True
+            self._on_done(error)
+
+
+class TillerInterceptor(grpc.UnaryUnaryClientInterceptor,
+                        grpc.UnaryStreamClientInterceptor):
+    """
+    Base class for Tiller client interceptors.
+
+    Tiller's RPCs are either unary or server-streaming, so subclasses only
+    override intercept(), which handles both. `continuation(call_details,
+    request)` sends the request down the rest of the pipeline and returns
+    a call: a future for unary calls, an iterator of responses for
+    streaming ones.
+    """
+
+    def intercept(self, continuation, client_call_details, request, streaming):
+        return continuation(client_call_details, request)
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        return self.intercept(continuation, client_call_details, request, False)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        return self.intercept(continuation, client_call_details, request, True)
+
+
+class TimingInterceptor(TillerInterceptor):
+    """
+    Time every RPC, from sending the request to receiving the last response.
+
+    `callback(method, seconds, code)` is called for every finished call;
+    timings are logged at debug level otherwise.
+    """
+
+    _logger = logger.get_logger('TimingInterceptor')
+
+    def __init__(self, callback=None):
+        self._callback = callback
+
+    def record(self, method, seconds, code):
+        if self._callback is not None:
+            self._callback(method, seconds, code)
+        else:
+            self._logger.debug("%s took %.3fs (%s)", method, seconds, code)
+
+    def intercept(self, continuation, client_call_details, request, streaming):
+        method = method_name(client_call_details)
+        start = time.time()
+        call = continuation(client_call_details, request)
+
+        if streaming:
+            return StreamingCall(call, lambda error: self.record(
+                method, time.time() - start,
+                error.code() if error is not None else grpc.StatusCode.OK))
+
+        call.add_done_callback(lambda done: self.record(
+            method, time.time() - start, done.code()))
+        return call
+
+
+class RetryPolicy(object):
+    """
+    How a call is retried: up to `max_attempts` attempts, failing with one of
+    `retryable_codes`, separated by an exponential backoff starting at
+    `initial_backoff` seconds with up to `jitter` of it randomly cut off.
+
+    All the attempts share a `deadline` budget, in seconds. By default the
+    budget is the call's own timeout, so retries never make a call last
+    longer than it would without them.
+    """
+
+    def __init__(self, max_attempts=3, initial_backoff=0.5, max_backoff=10,
+                 multiplier=2, jitter=0.5, retryable_codes=RETRYABLE_STATUS_CODES,
+                 deadline=None):
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retryable_codes = retryable_codes
+        self.deadline = deadline
+
+    def backoff(self, attempt):
+        """
+        Return how long to wait after the given (1-based) failed attempt
+        """
+        delay = min(self.max_backoff,
+                    self.initial_backoff * self.multiplier ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+class _ClientCallDetails(
+        collections.namedtuple('_ClientCallDetails',
+                               ('method', 'timeout', 'metadata', 'credentials',
+                                'wait_for_ready', 'compression')),
+        grpc.ClientCallDetails):
+    pass
+
+
+def with_timeout(client_call_details, timeout):
+    """
+    Return a copy of call details with a different timeout
+    """
+    return _ClientCallDetails(client_call_details.method, timeout,
+                              client_call_details.metadata,
+                              client_call_details.credentials,
+                              getattr(client_call_details, 'wait_for_ready', None),
+                              getattr(client_call_details, 'compression', None))
+
+
+class RetryInterceptor(TillerInterceptor):
+    """
+    Retry calls failing with a transient status code, following a RetryPolicy.
+
+    Read-only RPCs follow `read_policy`, writes follow `write_policy` and
+    aren't retried unless one is given. `policies` overrides the policy of
+    single methods, None disabling retries for them.
+
+    The responses of a retried streaming call are buffered until the call
+    succeeds, and a retried unary call blocks until it completes, even when
+    sent as a future.
+    """
+
+    _logger = logger.get_logger('RetryInterceptor')
+
+    def __init__(self, read_policy=DEFAULT_RETRY_POLICY, write_policy=None, policies=None):
+        self._policies = dict((method, read_policy) for method in READ_METHODS)
+        self._policies.update((method, write_policy) for method in WRITE_METHODS)
+        self._policies.update(policies or {})
+
+    def intercept(self, continuation, client_call_details, request, streaming):
+        method = method_name(client_call_details)
+        policy = self._policies.get(method)
+        if policy is None:
+            return continuation(client_call_details, request)
+
+        budget = policy.deadline or client_call_details.timeout
+        deadline = time.time() + budget if budget else None
+
+        attempt = 1
+        while True:
+            if deadline is not None:
+                client_call_details = with_timeout(client_call_details,
+                                                   max(0, deadline - time.time()))
+
+            call, code = self._attempt(continuation, client_call_details, request, streaming)
+            if code not in policy.retryable_codes or attempt >= policy.max_attempts:
+                return call
+
+            delay = policy.backoff(attempt)
+            if deadline is not None and time.time() + delay >= deadline:
+                self._logger.warn("%s failed with %s, no time left to retry", method, code)
+                return call
+
+            self._logger.warn("%s failed with %s, retrying in %.2fs (attempt %d/%d)",
+                              method, code, delay, attempt + 1, policy.max_attempts)
+            time.sleep(delay)
+            attempt += 1
+
+    def _attempt(self, continuation, client_call_details, request, streaming):
+        call = continuation(client_call_details, request)
+        if not streaming:
+            return call, call.code()
+
+        try:
+            return CompletedCall(list(call)), grpc.StatusCode.OK
+        except grpc.RpcError as rpc_error:
+            return CompletedCall(exception=rpc_error, code=rpc_error.code(),
+                                 details=rpc_error.details()), rpc_error.code()
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class CoalescingInterceptor(TillerInterceptor):
+    """
+    Coalesce concurrent identical read-only calls (same method and serialized
+    request) into a single RPC, whose outcome every caller receives.
+
+    Callers share the same response messages, which they shouldn't modify.
+    The responses of a streaming call are buffered before being shared.
+    """
+
+    def __init__(self, methods=READ_METHODS):
+        self._methods = methods
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def intercept(self, continuation, client_call_details, request, streaming):
+        method = method_name(client_call_details)
+        if method not in self._methods:
+            return continuation(client_call_details, request)
+
+        key = (method, request.SerializeToString())
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if leader:
+            try:
+                call = continuation(client_call_details, request)
+                if streaming:
+                    flight.response = list(call)
+                else:
+                    flight.error = call.exception()
+                    flight.response = call.result() if flight.error is None else None
+            except Exception as error:
+                flight.error = error
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            if not isinstance(flight.error, grpc.RpcError):
+                # e.g. the channel was closed, which every caller should see
+                raise flight.error
+            return CompletedCall(exception=flight.error, code=flight.error.code(),
+                                 details=flight.error.details())
+        return CompletedCall(flight.response)
+
+
+class CachingInterceptor(TillerInterceptor):
+    """
+    Cache the responses of read-only unary RPCs for `ttl` seconds.
+
+    Identical requests (same method and serialized request) are answered
+    from the cache. Any write going through the interceptor clears it, both
+    when it is sent and once it completes, and responses to reads made
+    while a write is in flight aren't cached.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 methods=('GetReleaseStatus', 'GetReleaseContent', 'GetHistory', 'GetVersion')):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._methods = methods
+        self._lock = threading.Lock()
+        self._responses = {}
+        # Bumped by every clear, so that reads overlapping one aren't cached
+        self._generation = 0
+        self._writes = 0
+
+    def clear(self):
+        with self._lock:
+            self._responses = {}
+            self._generation += 1
+
+    def _write(self, started):
+        with self._lock:
+            self._writes += 1 if started else -1
+        self.clear()
+
+    def intercept(self, continuation, client_call_details, request, streaming):
+        method = method_name(client_call_details)
+
+        if method in WRITE_METHODS:
+            self._write(True)
+            try:
+                call = continuation(client_call_details, request)
+            except Exception:
+                self._write(False)
+                raise
+            call.add_done_callback(lambda done: self._write(False))
+            return call
+
+        if streaming or method not in self._methods:
+            return continuation(client_call_details, request)
+
+        key = (method, request.SerializeToString())
+        with self._lock:
+            cached = self._responses.get(key)
+            generation = self._generation
+        if cached is not None and time.time() - cached[0] < self._ttl:
+            return CompletedCall(cached[1])
+
+        call = continuation(client_call_details, request)
+        if call.code() == grpc.StatusCode.OK:
+            with self._lock:
+                if generation != self._generation or self._writes:
+                    return call
+                if len(self._responses) >= self._max_entries:
+                    self._responses = {}
+                self._responses[key] = (time.time(), call.result())
+        return call
+
+
+class RequestSizeInterceptor(TillerInterceptor):
+    """
+    Account for the serialized size of the requests sent to tiller.
+
+    `sizes` maps each method to a (count, total bytes, largest request) tuple.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sizes = {}
+
+    def intercept(self, continuation, client_call_details, request, streaming):
+        method = method_name(client_call_details)
+        size = request.ByteSize()
+
+        with self._lock:
+            count, total, largest = self.sizes.get(method, (0, 0, 0))
+            self.sizes[method] = (count + 1, total + size, max(largest, size))
+
+        return continuation(client_call_details, request)
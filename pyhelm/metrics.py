@@ -0,0 +1,172 @@
+import threading
+import time
+import grpc
+
+from pyhelm.interceptors import TillerInterceptor, StreamingCall, method_name
+from pyhelm.tiller import GRPC_MAX_SEND_MESSAGE_LENGTH
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60, 120, 300)
+SIZE_BUCKETS = (1024, 16*1024, 256*1024, 1024*1024, 4*1024*1024,
+                16*1024*1024, 64*1024*1024)
+
+
+class Histogram(object):
+    """
+    A cumulative histogram, as exposed by Prometheus
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+class TillerMetrics(object):
+    """
+    Per-RPC metrics of a Tiller client: latency, request and response sizes,
+    number of streamed responses (e.g. ListReleases pages) and status codes.
+
+    Feed it with a MetricsInterceptor, export it with to_prometheus(), or
+    get every observation as a dict through `callback`.
+    """
+
+    def __init__(self, callback=None, latency_buckets=LATENCY_BUCKETS,
+                 size_buckets=SIZE_BUCKETS):
+        self._callback = callback
+        self._latency_buckets = latency_buckets
+        self._size_buckets = size_buckets
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.request_bytes = {}
+        self.response_bytes = {}
+        self.responses = {}
+        self.calls = {}
+
+    def observe(self, method, seconds, code, request_bytes=0, response_bytes=0,
+                responses=0, wait=False):
+        """
+        Record a finished call
+        """
+        wait = 'true' if wait else 'false'
+        with self._lock:
+            self._histogram(self.latency, (method, wait), self._latency_buckets).observe(seconds)
+            self._histogram(self.request_bytes, method, self._size_buckets).observe(request_bytes)
+            self._histogram(self.response_bytes, method, self._size_buckets).observe(response_bytes)
+            self.responses[method] = self.responses.get(method, 0) + responses
+            self.calls[(method, code.name)] = self.calls.get((method, code.name), 0) + 1
+
+        if self._callback is not None:
+            self._callback({
+                'method': method,
+                'seconds': seconds,
+                'code': code.name,
+                'wait': wait == 'true',
+                'request_bytes': request_bytes,
+                'response_bytes': response_bytes,
+                'responses': responses,
+            })
+
+    @staticmethod
+    def _histogram(histograms, key, buckets):
+        if key not in histograms:
+            histograms[key] = Histogram(buckets)
+        return histograms[key]
+
+    def to_prometheus(self, prefix='pyhelm_tiller'):
+        """
+        Return the metrics in the Prometheus text exposition format
+        """
+        lines = []
+
+        def labels(**kwargs):
+            return ','.join('%s="%s"' % (k, v) for k, v in sorted(kwargs.items()))
+
+        def histogram(name, help, histograms, keys):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help))
+            lines.append('# TYPE %s_%s histogram' % (prefix, name))
+            for key, hist in sorted(histograms.items()):
+                key_labels = dict(zip(keys, key if isinstance(key, tuple) else (key,)))
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append('%s_%s_bucket{%s} %d' % (prefix, name, labels(le=repr(float(bound)), **key_labels), count))
+                lines.append('%s_%s_bucket{%s} %d' % (prefix, name, labels(le='+Inf', **key_labels), hist.count))
+                lines.append('%s_%s_sum{%s} %s' % (prefix, name, labels(**key_labels), repr(float(hist.sum))))
+                lines.append('%s_%s_count{%s} %d' % (prefix, name, labels(**key_labels), hist.count))
+
+        with self._lock:
+            histogram('request_duration_seconds', 'Latency of Tiller RPCs, by method and wait flag.',
+                      self.latency, ('method', 'wait'))
+            histogram('request_bytes', 'Serialized size of Tiller requests.',
+                      self.request_bytes, ('method',))
+            histogram('response_bytes', 'Serialized size of Tiller responses.',
+                      self.response_bytes, ('method',))
+
+            lines.append('# HELP %s_request_bytes_max Largest Tiller request sent.' % prefix)
+            lines.append('# TYPE %s_request_bytes_max gauge' % prefix)
+            for method, hist in sorted(self.request_bytes.items()):
+                lines.append('%s_request_bytes_max{%s} %d' % (prefix, labels(method=method), hist.max))
+
+            lines.append('# HELP %s_max_send_bytes Maximum size of a request sent to Tiller.' % prefix)
+            lines.append('# TYPE %s_max_send_bytes gauge' % prefix)
+            lines.append('%s_max_send_bytes %d' % (prefix, GRPC_MAX_SEND_MESSAGE_LENGTH))
+
+            lines.append('# HELP %s_responses_total Responses received, e.g. ListReleases pages.' % prefix)
+            lines.append('# TYPE %s_responses_total counter' % prefix)
+            for method, count in sorted(self.responses.items()):
+                lines.append('%s_responses_total{%s} %d' % (prefix, labels(method=method), count))
+
+            lines.append('# HELP %s_calls_total Tiller RPCs, by method and status code.' % prefix)
+            lines.append('# TYPE %s_calls_total counter' % prefix)
+            for (method, code), count in sorted(self.calls.items()):
+                lines.append('%s_calls_total{%s} %d' % (prefix, labels(method=method, code=code), count))
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsInterceptor(TillerInterceptor):
+    """
+    Record every RPC going through a Tiller into a TillerMetrics
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def intercept(self, continuation, client_call_details, request, streaming):
+        method = method_name(client_call_details)
+        request_bytes = request.ByteSize()
+        wait = getattr(request, 'wait', False)
+        start = time.time()
+        call = continuation(client_call_details, request)
+
+        if streaming:
+            received = [0, 0]
+
+            def on_response(response):
+                received[0] += 1
+                received[1] += response.ByteSize()
+
+            def on_done(error):
+                self.metrics.observe(method, time.time() - start,
+                                     error.code() if error is not None else grpc.StatusCode.OK,
+                                     request_bytes, received[1], received[0], wait)
+
+            return StreamingCall(call, on_done, on_response)
+
+        def on_done(done):
+            code = done.code()
+            ok = code == grpc.StatusCode.OK
+            self.metrics.observe(method, time.time() - start, code, request_bytes,
+                                 done.result().ByteSize() if ok else 0, int(ok), wait)
+
+        call.add_done_callback(on_done)
+        return call
@@ -0,0 +1,271 @@
+import threading
+import time
+import grpc
+import pyhelm.logger as logger
+
+from hapi.services.tiller_pb2 import GetVersionRequest
+from hapi.services.tiller_pb2_grpc import ReleaseServiceStub
+from pyhelm.interceptors import READ_METHODS, StreamingCall
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+HEALTH_CHECK_INTERVAL = 10
+HEALTH_CHECK_TIMEOUT = 5
+EJECTION_TIME = 30
+
+
+class Endpoint(object):
+    """
+    A tiller endpoint of a ChannelPool, with its own channel
+    """
+
+    def __init__(self, target, channel):
+        self.target = target
+        self.channel = channel
+        self.outstanding = 0
+        self.ejected_until = 0
+        self._multicallables = {}
+
+    @property
+    def healthy(self):
+        return time.time() >= self.ejected_until
+
+    def multicallable(self, kind, method, request_serializer, response_deserializer):
+        # Tiller sends some calls through custom serializers, e.g. spliced
+        # chart bytes, so they must not share the stock multicallable
+        key = (kind, method, request_serializer, response_deserializer)
+        if key not in self._multicallables:
+            self._multicallables[key] = getattr(self.channel, kind)(
+                method,
+                request_serializer=request_serializer,
+                response_deserializer=response_deserializer)
+        return self._multicallables[key]
+
+
+class ChannelPool(grpc.Channel):
+    """
+    A channel spreading calls over several tiller endpoints, e.g. tiller
+    replicas or port-forwards to the same cluster.
+
+    Each call goes to a healthy endpoint picked round-robin, or to the one
+    with the fewest calls in flight with `policy=LEAST_OUTSTANDING`. An
+    endpoint failing a call with UNAVAILABLE, or a GetVersion health check,
+    is ejected for `ejection_time` seconds or until a health check succeeds.
+    Read-only unary calls fail over to the next endpoint right away; other
+    calls fail, and are sent elsewhere when retried.
+
+    Health checks run every `health_check_interval` seconds in a daemon
+    thread, unless it is None. When every endpoint is ejected, calls are
+    spread over all of them.
+    """
+
+    _logger = logger.get_logger('ChannelPool')
+
+    def __init__(self, channels, policy=ROUND_ROBIN,
+                 health_check_interval=HEALTH_CHECK_INTERVAL,
+                 health_check_timeout=HEALTH_CHECK_TIMEOUT,
+                 ejection_time=EJECTION_TIME, metadata=None):
+        if policy not in (ROUND_ROBIN, LEAST_OUTSTANDING):
+            raise ValueError("Unknown load balancing policy %s" % policy)
+
+        self.endpoints = [Endpoint(target, channel) for target, channel in channels]
+        if not self.endpoints:
+            raise ValueError("A channel pool needs at least one endpoint")
+
+        self._policy = policy
+        self._health_check_timeout = health_check_timeout
+        self._ejection_time = ejection_time
+        self._metadata = metadata
+        self._lock = threading.Lock()
+        self._next = 0
+        self._closed = threading.Event()
+
+        self._health_checker = None
+        if health_check_interval is not None:
+            self._health_checker = threading.Thread(target=self._check_health_every,
+                                                    args=(health_check_interval,))
+            self._health_checker.daemon = True
+            self._health_checker.start()
+
+    def acquire(self, exclude=()):
+        """
+        Pick the endpoint of a new call, counting it as outstanding
+        """
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            candidates = [e for e in candidates if e.healthy] or candidates
+            if not candidates:
+                return None
+
+            # Rotate the candidates so that least-outstanding ties are
+            # spread round-robin as well
+            start = self._next % len(candidates)
+            self._next += 1
+            candidates = candidates[start:] + candidates[:start]
+            if self._policy == LEAST_OUTSTANDING:
+                endpoint = min(candidates, key=lambda e: e.outstanding)
+            else:
+                endpoint = candidates[0]
+
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint, code):
+        """
+        Account for the end of a call, ejecting its endpoint if unavailable
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+        if code == grpc.StatusCode.UNAVAILABLE:
+            self.eject(endpoint)
+
+    def eject(self, endpoint):
+        if endpoint.healthy:
+            self._logger.warn("Tiller endpoint %s is unavailable, ejecting it for %ss",
+                              endpoint.target, self._ejection_time)
+        endpoint.ejected_until = time.time() + self._ejection_time
+
+    def check_health(self):
+        """
+        Probe every endpoint with GetVersion, ejecting or restoring them
+        """
+        for endpoint in self.endpoints:
+            try:
+                ReleaseServiceStub(endpoint.channel).GetVersion(
+                    GetVersionRequest(), self._health_check_timeout,
+                    metadata=self._metadata)
+            except grpc.RpcError:
+                self.eject(endpoint)
+            else:
+                if not endpoint.healthy:
+                    self._logger.info("Tiller endpoint %s is back", endpoint.target)
+                endpoint.ejected_until = 0
+
+    def _check_health_every(self, interval):
+        while not self._closed.wait(interval):
+            self.check_health()
+
+    def call(self, method, invoke):
+        """
+        Run `invoke(endpoint)` on a picked endpoint, failing over to the next
+        ones while read-only calls are unavailable
+        """
+        tried = []
+        while True:
+            endpoint = self.acquire(tried)
+            try:
+                result = invoke(endpoint)
+            except grpc.RpcError as rpc_error:
+                code = rpc_error.code()
+                self.release(endpoint, code)
+                tried.append(endpoint)
+                if code != grpc.StatusCode.UNAVAILABLE or \
+                        method.rsplit('/', 1)[-1] not in READ_METHODS or \
+                        len(tried) == len(self.endpoints):
+                    raise
+                self._logger.warn("%s failed on %s, failing over", method, endpoint.target)
+            else:
+                self.release(endpoint, grpc.StatusCode.OK)
+                return result
+
+    def subscribe(self, callback, try_to_connect=False):
+        for endpoint in self.endpoints:
+            endpoint.channel.subscribe(callback, try_to_connect)
+
+    def unsubscribe(self, callback):
+        for endpoint in self.endpoints:
+            endpoint.channel.unsubscribe(callback)
+
+    def unary_unary(self, method, request_serializer=None, response_deserializer=None,
+                    *args, **kwargs):
+        return _UnaryUnaryMultiCallable(self, method, request_serializer,
+                                        response_deserializer)
+
+    def unary_stream(self, method, request_serializer=None, response_deserializer=None,
+                     *args, **kwargs):
+        return _UnaryStreamMultiCallable(self, method, request_serializer,
+                                         response_deserializer)
+
+    def stream_unary(self, method, *args, **kwargs):
+        raise NotImplementedError("Tiller has no client-streaming RPCs")
+
+    def stream_stream(self, method, *args, **kwargs):
+        raise NotImplementedError("Tiller has no client-streaming RPCs")
+
+    def close(self):
+        self._closed.set()
+        for endpoint in self.endpoints:
+            endpoint.channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class _MultiCallable(object):
+
+    kind = None
+
+    def __init__(self, pool, method, request_serializer, response_deserializer):
+        self._pool = pool
+        self._method = method
+        self._request_serializer = request_serializer
+        self._response_deserializer = response_deserializer
+
+    def _multicallable(self, endpoint):
+        return endpoint.multicallable(self.kind, self._method,
+                                      self._request_serializer,
+                                      self._response_deserializer)
+
+
+class _UnaryUnaryMultiCallable(_MultiCallable, grpc.UnaryUnaryMultiCallable):
+
+    kind = 'unary_unary'
+
+    def __call__(self, request, timeout=None, metadata=None, credentials=None,
+                 wait_for_ready=None, compression=None):
+        return self._pool.call(self._method, lambda endpoint: self._multicallable(endpoint)(
+            request, timeout=timeout, metadata=metadata, credentials=credentials,
+            wait_for_ready=wait_for_ready, compression=compression))
+
+    def with_call(self, request, timeout=None, metadata=None, credentials=None,
+                  wait_for_ready=None, compression=None):
+        return self._pool.call(self._method, lambda endpoint: self._multicallable(endpoint).with_call(
+            request, timeout=timeout, metadata=metadata, credentials=credentials,
+            wait_for_ready=wait_for_ready, compression=compression))
+
+    def future(self, request, timeout=None, metadata=None, credentials=None,
+               wait_for_ready=None, compression=None):
+        endpoint = self._pool.acquire()
+        try:
+            future = self._multicallable(endpoint).future(
+                request, timeout=timeout, metadata=metadata, credentials=credentials,
+                wait_for_ready=wait_for_ready, compression=compression)
+        except Exception:
+            self._pool.release(endpoint, None)
+            raise
+
+        future.add_done_callback(lambda done: self._pool.release(endpoint, done.code()))
+        return future
+
+
+class _UnaryStreamMultiCallable(_MultiCallable, grpc.UnaryStreamMultiCallable):
+
+    kind = 'unary_stream'
+
+    def __call__(self, request, timeout=None, metadata=None, credentials=None,
+                 wait_for_ready=None, compression=None):
+        endpoint = self._pool.acquire()
+        try:
+            call = self._multicallable(endpoint)(
+                request, timeout=timeout, metadata=metadata, credentials=credentials,
+                wait_for_ready=wait_for_ready, compression=compression)
+        except Exception:
+            self._pool.release(endpoint, None)
+            raise
+
+        return StreamingCall(call, lambda error: self._pool.release(
+            endpoint, error.code() if error is not None else grpc.StatusCode.OK))
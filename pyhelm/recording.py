@@ -0,0 +1,154 @@
+import threading
+import time
+import grpc
+
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from pyhelm.interceptors import TillerInterceptor, StreamingCall, method_name
+from pyhelm.tiller import _varint
+
+# A recorded call, i.e. in protobuf IDL:
+#
+#   message Exchange {
+#     string method = 1;            // e.g. "ListReleases"
+#     int64 offset_us = 2;          // start of the call since the recording started
+#     int64 duration_us = 3;        // until the last response
+#     bytes request = 4;            // serialized request
+#     repeated bytes responses = 5; // serialized responses, one for unary calls
+#     int32 code = 6;               // grpc status code
+#     string details = 7;
+#   }
+_FIELDS = (
+    ('method', 1, descriptor_pb2.FieldDescriptorProto.TYPE_STRING, False),
+    ('offset_us', 2, descriptor_pb2.FieldDescriptorProto.TYPE_INT64, False),
+    ('duration_us', 3, descriptor_pb2.FieldDescriptorProto.TYPE_INT64, False),
+    ('request', 4, descriptor_pb2.FieldDescriptorProto.TYPE_BYTES, False),
+    ('responses', 5, descriptor_pb2.FieldDescriptorProto.TYPE_BYTES, True),
+    ('code', 6, descriptor_pb2.FieldDescriptorProto.TYPE_INT32, False),
+    ('details', 7, descriptor_pb2.FieldDescriptorProto.TYPE_STRING, False),
+)
+
+
+def _exchange_class():
+    file_proto = descriptor_pb2.FileDescriptorProto(name='pyhelm/recording.proto',
+                                                    package='pyhelm.recording',
+                                                    syntax='proto3')
+    message_proto = file_proto.message_type.add(name='Exchange')
+    for name, number, field_type, repeated in _FIELDS:
+        message_proto.field.add(
+            name=name, number=number, type=field_type,
+            label=descriptor_pb2.FieldDescriptorProto.LABEL_REPEATED if repeated
+            else descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    descriptor = pool.FindMessageTypeByName('pyhelm.recording.Exchange')
+    if hasattr(message_factory, 'GetMessageClass'):
+        return message_factory.GetMessageClass(descriptor)
+    return message_factory.MessageFactory(pool).GetPrototype(descriptor)
+
+
+Exchange = _exchange_class()
+
+STATUS_CODES = dict((code.value[0], code) for code in grpc.StatusCode)
+
+
+def write_exchange(stream, exchange):
+    """
+    Append an Exchange to a file, prefixed with its length as a varint
+    """
+    data = exchange.SerializeToString()
+    stream.write(_varint(len(data)) + data)
+
+
+def read_exchanges(stream):
+    """
+    Yield the Exchanges of a file written by write_exchange
+    """
+    while True:
+        length = shift = 0
+        while True:
+            byte = stream.read(1)
+            if not byte:
+                if shift:
+                    raise ValueError("Truncated recording")
+                return
+            length |= (ord(byte) & 0x7f) << shift
+            shift += 7
+            if not ord(byte) & 0x80:
+                break
+
+        data = stream.read(length)
+        if len(data) != length:
+            raise ValueError("Truncated recording")
+        yield Exchange.FromString(data)
+
+
+class RecordingInterceptor(TillerInterceptor):
+    """
+    Record every call going through a Tiller (its request, responses,
+    status and timings) to a file of length-delimited Exchange messages,
+    which a ReplayTiller serves back.
+
+    `methods` restricts the recording to some RPCs. Call close() once
+    done, or use the interceptor as a context manager.
+    """
+
+    def __init__(self, path, methods=None):
+        self._stream = open(path, 'wb')
+        self._methods = methods
+        self._lock = threading.Lock()
+        self._start = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._stream.close()
+
+    def record(self, method, start, request, responses, code, details):
+        exchange = Exchange(method=method,
+                            offset_us=int((start - self._start) * 1e6),
+                            duration_us=int((time.time() - start) * 1e6),
+                            request=request,
+                            responses=responses,
+                            code=code.value[0],
+                            details=details or '')
+        with self._lock:
+            if not self._stream.closed:
+                write_exchange(self._stream, exchange)
+                self._stream.flush()
+
+    def intercept(self, continuation, client_call_details, request, streaming):
+        method = method_name(client_call_details)
+        if self._methods is not None and method not in self._methods:
+            return continuation(client_call_details, request)
+
+        data = request.SerializeToString()
+        start = time.time()
+        call = continuation(client_call_details, request)
+
+        if streaming:
+            responses = []
+
+            def on_done(error):
+                if error is None:
+                    self.record(method, start, data, responses, grpc.StatusCode.OK, None)
+                else:
+                    self.record(method, start, data, responses, error.code(), error.details())
+
+            return StreamingCall(call, on_done,
+                                 lambda response: responses.append(response.SerializeToString()))
+
+        def on_done(done):
+            if done.code() == grpc.StatusCode.OK:
+                self.record(method, start, data, [done.result().SerializeToString()],
+                            grpc.StatusCode.OK, None)
+            else:
+                self.record(method, start, data, [], done.code(), done.details())
+
+        call.add_done_callback(on_done)
+        return call
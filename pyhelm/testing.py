@@ -0,0 +1,373 @@
+import re
+import threading
+import time
+from concurrent import futures
+import grpc
+
+from hapi.services import tiller_pb2
+from hapi.services.tiller_pb2_grpc import ReleaseServiceServicer, \
+    add_ReleaseServiceServicer_to_server
+from hapi.release.release_pb2 import Release
+from hapi.release.status_pb2 import Status
+from hapi.version.version_pb2 import Version
+from pyhelm.tiller import Tiller, GRPC_CHANNEL_OPTIONS
+from pyhelm.recording import STATUS_CODES, read_exchanges
+
+FAKE_TILLER_VERSION = 'v2.14.3'
+FAKE_TILLER_MAX_WORKERS = 16
+RELEASE_SERVICE = 'hapi.services.tiller.ReleaseService'
+UNARY_METHODS = ('GetReleaseStatus', 'GetReleaseContent', 'UpdateRelease',
+                 'InstallRelease', 'UninstallRelease', 'GetVersion',
+                 'RollbackRelease', 'GetHistory')
+STREAMING_METHODS = ('ListReleases', 'RunReleaseTest')
+
+
+class FakeTiller(ReleaseServiceServicer):
+    """
+    An in-process tiller serving an in-memory release store over real gRPC,
+    for tests, benchmarks and load tests of the client.
+
+    :params - latency - seconds added to every call, or a dict of them by method
+    :params - page_size - maximum number of releases per ListReleases response
+                          message, all of them in a single message if None
+    :params - releases - Release messages to start with, every revision of
+                         every release
+
+    Like tiller, ListReleases only lists DEPLOYED releases unless asked for
+    other status codes, and a missing release fails with an UNKNOWN status
+    and a 'release: "name" not found' message. Use fail() to inject errors.
+
+        with FakeTiller(latency=0.01) as fake:
+            tiller = fake.tiller()
+    """
+
+    def __init__(self, latency=0, page_size=None, releases=(),
+                 max_workers=FAKE_TILLER_MAX_WORKERS):
+        self.latency = latency
+        self.page_size = page_size
+        self.calls = []
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._releases = {}
+        # The sorted releases of the latest listing, reused while paginating
+        # until the store changes
+        self._generation = 0
+        self._listing = (None, None, None)
+        for release in releases:
+            self.add(release)
+
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers),
+                                   options=GRPC_CHANNEL_OPTIONS)
+        add_ReleaseServiceServicer_to_server(self, self._server)
+        self.port = self._server.add_insecure_port('localhost:0')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._server.start()
+        return self
+
+    def stop(self, grace=None):
+        self._server.stop(grace)
+
+    def tiller(self, **kwargs):
+        """
+        Return a Tiller talking to this fake
+        """
+        return Tiller('localhost', port=self.port, **kwargs)
+
+    def add(self, release):
+        """
+        Store a revision of a release
+        """
+        with self._lock:
+            revisions = self._releases.setdefault(release.name, [])
+            revisions.append(release)
+            revisions.sort(key=lambda r: r.version)
+            self._generation += 1
+
+    def releases(self, name):
+        """
+        Return every stored revision of a release, oldest first
+        """
+        with self._lock:
+            return list(self._releases.get(name, []))
+
+    def fail(self, method, code=grpc.StatusCode.UNAVAILABLE, times=1, details='injected failure'):
+        """
+        Make the next `times` calls of a method fail
+        """
+        with self._lock:
+            self._failures.setdefault(method, []).extend([(code, details)] * times)
+
+    def _call(self, method, context):
+        """
+        Account for a call, applying latency and injected failures
+        """
+        with self._lock:
+            self.calls.append(method)
+            failures = self._failures.get(method)
+            failure = failures.pop(0) if failures else None
+
+        latency = self.latency.get(method, 0) if isinstance(self.latency, dict) else self.latency
+        if latency:
+            time.sleep(latency)
+        if failure is not None:
+            context.abort(*failure)
+
+    def _latest(self, name, context, version=0):
+        revisions = self._releases.get(name)
+        if not revisions:
+            context.abort(grpc.StatusCode.UNKNOWN, 'release: "%s" not found' % name)
+        if not version:
+            return revisions[-1]
+        for revision in revisions:
+            if revision.version == version:
+                return revision
+        context.abort(grpc.StatusCode.UNKNOWN, 'release: "%s" not found' % name)
+
+    def _deploy(self, name, namespace, chart, config, version, description, dry_run):
+        release = Release(name=name, namespace=namespace, version=version,
+                          chart=chart, config=config)
+        now = time.time()
+        release.info.status.code = Status.DEPLOYED
+        release.info.first_deployed.seconds = int(now)
+        release.info.last_deployed.seconds = int(now)
+        release.info.Description = description
+
+        if not dry_run:
+            with self._lock:
+                for revision in self._releases.get(name, []):
+                    if revision.info.status.code == Status.DEPLOYED:
+                        revision.info.status.code = Status.SUPERSEDED
+                self._releases.setdefault(name, []).append(release)
+                self._generation += 1
+        return release
+
+    def ListReleases(self, request, context):
+        self._call('ListReleases', context)
+        releases, positions = self._list(request)
+
+        start = positions.get(request.offset, len(releases)) if request.offset else 0
+        limit = request.limit or len(releases)
+        page = releases[start:start + limit]
+        following = releases[start + limit:start + limit + 1]
+        next_name = following[0].name if following else ''
+
+        page_size = self.page_size or len(page) or 1
+        for chunk in range(0, max(len(page), 1), page_size):
+            yield tiller_pb2.ListReleasesResponse(count=len(page), total=len(releases),
+                                                  next=next_name,
+                                                  releases=page[chunk:chunk + page_size])
+
+    def _list(self, request):
+        """
+        Return the releases a listing request matches, in order, and the
+        position of the first revision of each release among them
+        """
+        key = (tuple(request.status_codes), request.namespace, request.filter,
+               request.sort_by, request.sort_order)
+        with self._lock:
+            generation, listing_key, listing = self._listing
+            if generation == self._generation and listing_key == key:
+                return listing
+
+            status_codes = set(request.status_codes or [Status.DEPLOYED])
+            releases = [r for revisions in self._releases.values() for r in revisions
+                        if r.info.status.code in status_codes and
+                        (not request.namespace or r.namespace == request.namespace) and
+                        (not request.filter or re.search(request.filter, r.name))]
+            generation = self._generation
+
+        sort_keys = {
+            tiller_pb2.ListSort.LAST_RELEASED: lambda r: r.info.last_deployed.seconds,
+            tiller_pb2.ListSort.CHART_NAME: lambda r: r.chart.metadata.name,
+        }
+        releases.sort(key=lambda r: (r.name, r.version))
+        releases.sort(key=sort_keys.get(request.sort_by, lambda r: r.name),
+                      reverse=request.sort_order == tiller_pb2.ListSort.DESC)
+
+        positions = {}
+        for position, release in enumerate(releases):
+            positions.setdefault(release.name, position)
+
+        with self._lock:
+            self._listing = (generation, key, (releases, positions))
+        return releases, positions
+
+    def GetReleaseStatus(self, request, context):
+        self._call('GetReleaseStatus', context)
+        with self._lock:
+            release = self._latest(request.name, context, request.version)
+        return tiller_pb2.GetReleaseStatusResponse(name=release.name,
+                                                   namespace=release.namespace,
+                                                   info=release.info)
+
+    def GetReleaseContent(self, request, context):
+        self._call('GetReleaseContent', context)
+        with self._lock:
+            release = self._latest(request.name, context, request.version)
+        return tiller_pb2.GetReleaseContentResponse(release=release)
+
+    def GetHistory(self, request, context):
+        self._call('GetHistory', context)
+        with self._lock:
+            revisions = self._releases.get(request.name, [])[::-1]
+        return tiller_pb2.GetHistoryResponse(releases=revisions[:request.max or None])
+
+    def InstallRelease(self, request, context):
+        self._call('InstallRelease', context)
+        with self._lock:
+            exists = bool(self._releases.get(request.name))
+        if exists and not request.reuse_name:
+            context.abort(grpc.StatusCode.UNKNOWN,
+                          'a release named %s already exists' % request.name)
+
+        release = self._deploy(request.name, request.namespace, request.chart, request.values,
+                               1, request.description or 'Install complete', request.dry_run)
+        return tiller_pb2.InstallReleaseResponse(release=release)
+
+    def UpdateRelease(self, request, context):
+        self._call('UpdateRelease', context)
+        with self._lock:
+            current = self._latest(request.name, context)
+        release = self._deploy(request.name, current.namespace, request.chart, request.values,
+                               current.version + 1, request.description or 'Upgrade complete',
+                               request.dry_run)
+        return tiller_pb2.UpdateReleaseResponse(release=release)
+
+    def RollbackRelease(self, request, context):
+        self._call('RollbackRelease', context)
+        with self._lock:
+            current = self._latest(request.name, context)
+            target = self._latest(request.name, context, request.version or current.version - 1)
+        release = self._deploy(request.name, current.namespace, target.chart, target.config,
+                               current.version + 1,
+                               request.description or 'Rollback to %d' % target.version,
+                               request.dry_run)
+        return tiller_pb2.RollbackReleaseResponse(release=release)
+
+    def UninstallRelease(self, request, context):
+        self._call('UninstallRelease', context)
+        with self._lock:
+            release = self._latest(request.name, context)
+            if request.purge:
+                del self._releases[request.name]
+            else:
+                release.info.status.code = Status.DELETED
+            self._generation += 1
+        return tiller_pb2.UninstallReleaseResponse(release=release)
+
+    def GetVersion(self, request, context):
+        self._call('GetVersion', context)
+        return tiller_pb2.GetVersionResponse(Version=Version(sem_ver=FAKE_TILLER_VERSION))
+
+    def RunReleaseTest(self, request, context):
+        self._call('RunReleaseTest', context)
+        with self._lock:
+            self._latest(request.name, context)
+        yield tiller_pb2.TestReleaseResponse(msg='RUNNING: %s-test' % request.name)
+        yield tiller_pb2.TestReleaseResponse(msg='PASSED: %s-test' % request.name)
+
+
+class ReplayTiller(object):
+    """
+    Serve a recording made by a RecordingInterceptor back over gRPC, with
+    its original timings divided by `speed` (0 disabling them), to profile
+    the client against a production-shaped workload without a cluster.
+
+    A request gets the response recorded for the same method and request:
+    identical requests get their recorded exchanges in turn, the last one
+    being repeated. Other requests get the exchanges recorded for their
+    method in turn, and fail with UNIMPLEMENTED if there are none.
+    Responses are served as recorded, without being decoded.
+    """
+
+    def __init__(self, path, speed=1, max_workers=FAKE_TILLER_MAX_WORKERS):
+        self.speed = speed
+        self.calls = []
+        self._lock = threading.Lock()
+        self._served = {}
+        self._exchanges = {}
+        self._method_exchanges = {}
+        with open(path, 'rb') as recording:
+            for exchange in read_exchanges(recording):
+                self._exchanges.setdefault((exchange.method, exchange.request), []).append(exchange)
+                self._method_exchanges.setdefault(exchange.method, []).append(exchange)
+
+        handlers = dict((method, grpc.unary_unary_rpc_method_handler(self._unary(method)))
+                        for method in UNARY_METHODS)
+        handlers.update((method, grpc.unary_stream_rpc_method_handler(self._streaming(method)))
+                        for method in STREAMING_METHODS)
+
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers),
+                                   options=GRPC_CHANNEL_OPTIONS)
+        self._server.add_generic_rpc_handlers(
+            (grpc.method_handlers_generic_handler(RELEASE_SERVICE, handlers),))
+        self.port = self._server.add_insecure_port('localhost:0')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._server.start()
+        return self
+
+    def stop(self, grace=None):
+        self._server.stop(grace)
+
+    def tiller(self, **kwargs):
+        """
+        Return a Tiller talking to this replay
+        """
+        return Tiller('localhost', port=self.port, **kwargs)
+
+    def _exchange(self, method, request, context):
+        with self._lock:
+            self.calls.append(method)
+            key = (method, request)
+            if key in self._exchanges:
+                exchanges = self._exchanges[key]
+                served = self._served.get(key, 0)
+                self._served[key] = served + 1
+                return exchanges[min(served, len(exchanges) - 1)]
+
+            exchanges = self._method_exchanges.get(method)
+            if exchanges:
+                served = self._served.get(method, 0)
+                self._served[method] = served + 1
+                return exchanges[served % len(exchanges)]
+
+        context.abort(grpc.StatusCode.UNIMPLEMENTED, 'No %s call was recorded' % method)
+
+    def _wait(self, microseconds):
+        if self.speed:
+            time.sleep(microseconds / 1e6 / self.speed)
+
+    def _unary(self, method):
+        def handler(request, context):
+            exchange = self._exchange(method, request, context)
+            self._wait(exchange.duration_us)
+            if exchange.code:
+                context.abort(STATUS_CODES[exchange.code], exchange.details)
+            return exchange.responses[0]
+        return handler
+
+    def _streaming(self, method):
+        def handler(request, context):
+            exchange = self._exchange(method, request, context)
+            # Spread the duration of the call over its responses
+            delay = exchange.duration_us / max(1, len(exchange.responses))
+            for response in exchange.responses:
+                self._wait(delay)
+                yield response
+            if exchange.code:
+                context.abort(STATUS_CODES[exchange.code], exchange.details)
+        return handler
@@ -1,12 +1,28 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
 import grpc
 import yaml
+from collections import OrderedDict
+from concurrent import futures
 import pyhelm.logger as logger
+from pyhelm.interceptors import RetryInterceptor, CoalescingInterceptor, \
+    CompletedCall, DEFAULT_RETRY_POLICY
+from pyhelm.pool import ChannelPool, ROUND_ROBIN, HEALTH_CHECK_INTERVAL
 
 from hapi.services.tiller_pb2 import ListReleasesRequest, \
     InstallReleaseRequest, UpdateReleaseRequest, UninstallReleaseRequest, \
-    GetReleaseStatusRequest, GetReleaseContentRequest
+    GetReleaseStatusRequest, GetReleaseContentRequest, GetHistoryRequest, \
+    RollbackReleaseRequest, TestReleaseRequest, GetVersionRequest, ListSort, \
+    GetReleaseStatusResponse, GetReleaseContentResponse, UpdateReleaseResponse, \
+    InstallReleaseResponse
 from hapi.services.tiller_pb2_grpc import ReleaseServiceStub
+from hapi.chart.chart_pb2 import Chart
 from hapi.chart.config_pb2 import Config
+from hapi.release.release_pb2 import Release
 from hapi.release.status_pb2 import _STATUS
 
 TILLER_PORT = 44134
@@ -18,6 +34,574 @@ GRPC_MAX_RECEIVE_MESSAGE_LENGTH = 1024*1024*50
 GRPC_MAX_SEND_MESSAGE_LENGTH = 1024*1024*20
 GRPC_KEEPALIVE_TIME_MS = 90000
 GRPC_MIN_TIME_BETWEEN_PINGS_MS = 90000
+APPLY_MAX_WORKERS = 8
+RELEASE_CACHE_TTL = 30
+RELEASE_CACHE_FULL_REFRESH_INTERVAL = 600
+REVISION_CACHE_MAX_BYTES = 1024*1024*256
+LIST_MAX_WORKERS = 8
+PAYLOAD_REPORT_TOP = 10
+READY_TIMEOUT = 5
+READY_CACHE_TTL = 30
+
+# Release names start with a letter or a digit, in either case
+RELEASE_NAME_PARTITIONS = tuple('abcdefghijklmnopqrstuvwxyz0123456789')
+
+# Older grpcio releases can't open a new channel in a forked child once the
+# parent used gRPC: the call fails, or hangs with GRPC_ENABLE_FORK_SUPPORT=1
+FORK_MIN_GRPCIO_VERSION = (1, 64)
+
+COMPRESSION_ALGORITHMS = {
+    'gzip': grpc.Compression.Gzip,
+    'deflate': grpc.Compression.Deflate,
+}
+
+# Despite Helm sets grpc keep alive to 30 seconds, it handles grpc "too_many_pings" errors
+# which we don't want to handle. Setting it to 30 seconds will cause such an error at times.
+GRPC_CHANNEL_OPTIONS = (
+    ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+    ("grpc.http2.min_time_between_pings_ms", GRPC_MIN_TIME_BETWEEN_PINGS_MS),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.max_receive_message_length", GRPC_MAX_RECEIVE_MESSAGE_LENGTH),
+    ("grpc.max_send_message_length", GRPC_MAX_SEND_MESSAGE_LENGTH)
+)
+
+
+def status_code_numbers(status_codes):
+    """
+    Convert status code names (e.g. "DEPLOYED") to their numerical values
+    """
+    if not status_codes:
+        return []
+
+    codes_enum = _STATUS.enum_types_by_name.get("Code")
+    return [codes_enum.values_by_name.get(code).number for code in status_codes]
+
+
+def list_sort_number(enum_name, value):
+    """
+    Convert a ListSort SortBy/SortOrder name (e.g. "LAST_RELEASED") to its numerical value
+    """
+    if not value:
+        return 0
+
+    if isinstance(value, int):
+        return value
+
+    return ListSort.DESCRIPTOR.enum_types_by_name.get(enum_name).values_by_name.get(value).number
+
+
+def fork_supported():
+    """
+    Return whether the installed grpcio lets a Tiller reconnect after a fork
+    """
+    version = tuple(int(part) for part in re.findall(r'\d+', grpc.__version__)[:2])
+    return version >= FORK_MIN_GRPCIO_VERSION
+
+
+def compression_algorithm(compression):
+    """
+    Convert a compression name ("gzip" or "deflate") to a grpc.Compression
+    """
+    if compression is None or isinstance(compression, grpc.Compression):
+        return compression
+
+    if compression not in COMPRESSION_ALGORITHMS:
+        raise ValueError("Unknown compression %s, expected one of %s" %
+                         (compression, ', '.join(sorted(COMPRESSION_ALGORITHMS))))
+    return COMPRESSION_ALGORITHMS[compression]
+
+
+def release_digest(chart, values):
+    """
+    Return a stable digest of a chart and its values
+
+    The chart is serialized deterministically and the values are normalized
+    through YAML, so equal charts and values always produce the same digest.
+    """
+    if isinstance(chart, SerializedChart):
+        chart = chart.chart
+
+    digest = hashlib.sha256(chart.SerializeToString(deterministic=True))
+    digest.update(yaml.safe_dump(values or {}).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def chart_sizes(chart, prefix=''):
+    """
+    Yield (path, bytes) pairs of the serialized size of every part of a
+    chart: its Chart.yaml, values.yaml, templates and files, then those of
+    its dependencies under charts/<name>/
+    """
+    yield prefix + 'Chart.yaml', chart.metadata.ByteSize()
+    yield prefix + 'values.yaml', chart.values.ByteSize()
+    for template in chart.templates:
+        yield prefix + template.name, template.ByteSize()
+    for chart_file in chart.files:
+        yield prefix + chart_file.type_url, chart_file.ByteSize()
+    for dependency in chart.dependencies:
+        for path, size in chart_sizes(dependency, '%scharts/%s/' % (prefix, dependency.metadata.name)):
+            yield path, size
+
+
+class PayloadReport(object):
+    """
+    Where the bytes of a release request (or a chart) go
+
+    `total` is the serialized size of the request, `files` lists the
+    (path, bytes) of every chart file, largest first, and `dependencies`
+    maps each dependency chart to its serialized size.
+    """
+
+    def __init__(self, message):
+        chart = getattr(message, 'chart', message)
+        self.total = message.ByteSize()
+        self.files = sorted(chart_sizes(chart), key=lambda item: (-item[1], item[0]))
+        self.dependencies = dict((dependency.metadata.name, dependency.ByteSize())
+                                 for dependency in chart.dependencies)
+
+    def largest(self, count=PAYLOAD_REPORT_TOP):
+        return self.files[:count]
+
+    def format(self, count=PAYLOAD_REPORT_TOP):
+        lines = ['%d bytes in total, largest files:' % self.total]
+        lines.extend('  %10d  %s' % (size, path) for path, size in self.largest(count))
+        if self.dependencies:
+            lines.append('dependencies:')
+            lines.extend('  %10d  %s' % (size, name) for name, size in
+                         sorted(self.dependencies.items(), key=lambda item: (-item[1], item[0])))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format()
+
+
+class PayloadTooLargeError(RuntimeError):
+    def __init__(self, report, limit):
+        self.report = report
+        self.limit = limit
+        super(PayloadTooLargeError, self).__init__(
+            'Release request of %d bytes exceeds the %d bytes tiller accepts\n%s' %
+            (report.total, limit, report))
+
+
+def release_not_found(rpc_error, name):
+    """
+    Return whether a failed call means the release doesn't exist
+    """
+    return "release: \"{}\" not found".format(name) in (rpc_error.details() or "")
+
+
+def release_namespaces(releases):
+    """
+    Map release names to their namespace
+
+    Accepts a mapping of names to namespaces, or an iterable of release names,
+    Release messages or ReleaseSummary objects. Namespaces are None when only
+    names are known.
+    """
+    if isinstance(releases, dict):
+        return releases
+
+    return dict((release, None) if isinstance(release, str) else (release.name, release.namespace)
+                for release in releases)
+
+
+def _timestamp(timestamp):
+    return timestamp.seconds, timestamp.nanos
+
+
+def _varint(value):
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+class SerializedChart(object):
+    """
+    A chart serialized once, e.g. by ChartBuilder.dump(), which Tiller
+    accepts wherever it takes a chart.
+
+    Its bytes are spliced as they are into the encoding of every install
+    or upgrade request sending it, so deploying a large chart many times
+    doesn't copy and re-encode it each time.
+    """
+
+    def __init__(self, chart):
+        if isinstance(chart, bytes):
+            self.data = chart
+            self._chart = None
+        else:
+            self.data = chart.SerializeToString()
+            self._chart = chart
+
+    @property
+    def chart(self):
+        """
+        The Chart message, only decoded when first needed
+        """
+        if self._chart is None:
+            self._chart = Chart.FromString(self.data)
+        return self._chart
+
+    def ByteSize(self):
+        return len(self.data)
+
+
+class SplicedRequest(object):
+    """
+    An install or update request whose chart is a SerializedChart, encoded
+    as the request without its chart followed by the chart field.
+
+    Protobuf allows fields in any order, so tiller decodes it like the
+    request with its chart. Other attributes are forwarded to the request.
+    """
+
+    def __init__(self, request, serialized_chart):
+        self._request = request
+        self._serialized_chart = serialized_chart
+        field = request.DESCRIPTOR.fields_by_name['chart'].number
+        # Wire type 2: length-delimited
+        self._chart_header = _varint(field << 3 | 2) + _varint(len(serialized_chart.data))
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+    @property
+    def chart(self):
+        return self._serialized_chart.chart
+
+    def ByteSize(self):
+        return self._request.ByteSize() + len(self._chart_header) + \
+            self._serialized_chart.ByteSize()
+
+    def SerializeToString(self):
+        return self._request.SerializeToString() + self._chart_header + \
+            self._serialized_chart.data
+
+
+def _serialize(request):
+    return request.SerializeToString()
+
+
+class _SplicingStub(object):
+    """
+    The release-sending RPCs of ReleaseServiceStub, with a serializer that
+    also takes SplicedRequests
+    """
+
+    def __init__(self, channel):
+        self.InstallRelease = channel.unary_unary(
+            '/hapi.services.tiller.ReleaseService/InstallRelease',
+            request_serializer=_serialize,
+            response_deserializer=InstallReleaseResponse.FromString)
+        self.UpdateRelease = channel.unary_unary(
+            '/hapi.services.tiller.ReleaseService/UpdateRelease',
+            request_serializer=_serialize,
+            response_deserializer=UpdateReleaseResponse.FromString)
+
+
+class ReleaseSummary(object):
+    """
+    A lightweight projection of a Release, keeping only the fields needed
+    for inventories and dropping the chart, values and manifest
+    """
+
+    __slots__ = ('name', 'namespace', 'version', 'status', 'chart_name',
+                 'chart_version', 'first_deployed', 'last_deployed',
+                 'description')
+
+    def __init__(self, name, namespace, version, status, chart_name,
+                 chart_version, first_deployed, last_deployed, description):
+        self.name = name
+        self.namespace = namespace
+        self.version = version
+        self.status = status
+        self.chart_name = chart_name
+        self.chart_version = chart_version
+        self.first_deployed = first_deployed
+        self.last_deployed = last_deployed
+        self.description = description
+
+    @classmethod
+    def from_release(cls, release):
+        """
+        Project a hapi.release.Release message into a summary
+        """
+        codes_enum = _STATUS.enum_types_by_name.get("Code")
+        info = release.info
+        metadata = release.chart.metadata
+
+        return cls(
+            name=release.name,
+            namespace=release.namespace,
+            version=release.version,
+            status=codes_enum.values_by_number[info.status.code].name,
+            chart_name=metadata.name,
+            chart_version=metadata.version,
+            first_deployed=info.first_deployed.seconds + info.first_deployed.nanos / 1e9,
+            last_deployed=info.last_deployed.seconds + info.last_deployed.nanos / 1e9,
+            description=info.Description)
+
+    def __repr__(self):
+        return '<ReleaseSummary %s.%s v%s %s>' % (self.namespace, self.name,
+                                                  self.version, self.status)
+
+
+class ReleaseCache(object):
+    """
+    An opt-in, in-memory index of the latest revision of every release,
+    by name and namespace, shared by the Tiller objects it is given to.
+
+    Entries are served for `ttl` seconds. Once expired the index is
+    refreshed incrementally: releases are listed by LAST_RELEASED,
+    newest first, and listing stops past the revisions deployed at the
+    same time as the first one that is already cached. Writes made
+    through a Tiller object using the cache mark the release they touch
+    as stale, and stale releases are fetched again by the next refresh,
+    whether or not the write created a revision. Releases deleted by
+    other clients are only noticed by the full refresh done every
+    `full_refresh_interval` seconds.
+    """
+
+    # Every status but SUPERSEDED, which only ever applies to old revisions
+    STATUS_CODES = [code for code in _STATUS.enum_types_by_name.get("Code").values_by_name
+                    if code != "SUPERSEDED"]
+
+    def __init__(self, ttl=RELEASE_CACHE_TTL,
+                 full_refresh_interval=RELEASE_CACHE_FULL_REFRESH_INTERVAL):
+        self._ttl = ttl
+        self._full_refresh_interval = full_refresh_interval
+        self._lock = threading.RLock()
+        self._releases = {}
+        self._stale = set()
+        self._refreshed_at = None
+        self._full_refreshed_at = None
+
+    def covers(self, status_codes=None, filter="", sort_by=None, sort_order=None):
+        """
+        Return whether a listing with these arguments can be served from the cache
+        """
+        if filter or sort_by or sort_order:
+            return False
+
+        return set(status_codes or ["DEPLOYED"]).issubset(self.STATUS_CODES)
+
+    def expired(self):
+        return self._refreshed_at is None or \
+            time.time() - self._refreshed_at > self._ttl
+
+    def invalidate(self, name=None):
+        """
+        Mark a release as stale, if given, and refresh the index on the next read
+        """
+        with self._lock:
+            if name is not None:
+                self._stale.add(name)
+            self._refreshed_at = None
+
+    def clear(self):
+        """
+        Drop the whole index, forcing a full refresh on the next read
+        """
+        with self._lock:
+            self._releases = {}
+            self._stale = set()
+            self._refreshed_at = None
+            self._full_refreshed_at = None
+
+    def refresh(self, tiller, full=False):
+        """
+        Bring the index up to date with tiller
+        """
+        with self._lock:
+            now = time.time()
+            full = full or self._full_refreshed_at is None or \
+                (self._full_refresh_interval is not None and
+                 now - self._full_refreshed_at > self._full_refresh_interval)
+
+            releases = {} if full else dict(self._releases)
+            stale = set() if full else set(self._stale)
+            cutoff = None
+            for release in tiller.iter_releases(status_codes=self.STATUS_CODES,
+                                                sort_by="LAST_RELEASED",
+                                                sort_order="DESC"):
+                deployed = _timestamp(release.info.last_deployed)
+                if cutoff is not None and deployed < cutoff:
+                    # Everything past this point is older than what we have
+                    break
+
+                cached = releases.get(release.name)
+                if cached is None or cached.version < release.version or \
+                        release.name in stale:
+                    releases[release.name] = release
+                    stale.discard(release.name)
+                elif not full and cutoff is None and cached.version == release.version:
+                    # Revisions deployed in the same second may come in any
+                    # order, so keep listing those
+                    cutoff = deployed
+
+            # Stale releases the listing didn't reach, e.g. after a failed
+            # write that didn't create a revision, or deleted ones
+            for name in stale:
+                try:
+                    releases[name] = tiller.get_release_content(name).release
+                except grpc.RpcError as rpc_error:
+                    if not release_not_found(rpc_error, name):
+                        raise
+                    releases.pop(name, None)
+
+            self._releases = releases
+            self._stale = set()
+            self._refreshed_at = now
+            if full:
+                self._full_refreshed_at = now
+
+    def get(self, tiller, name):
+        """
+        Return the latest cached revision of a release, or None
+        """
+        with self._lock:
+            if self.expired():
+                self.refresh(tiller)
+            return self._releases.get(name)
+
+    def releases(self, tiller, status_codes=None, namespace=""):
+        """
+        Return the cached releases matching a status and namespace, sorted by name
+        """
+        codes = status_code_numbers(status_codes or ["DEPLOYED"])
+
+        with self._lock:
+            if self.expired():
+                self.refresh(tiller)
+            releases = list(self._releases.values())
+
+        return sorted([release for release in releases
+                       if release.info.status.code in codes and
+                       (not namespace or release.namespace == namespace)],
+                      key=lambda release: release.name)
+
+
+class RevisionCache(object):
+    """
+    A bounded LRU of release revisions keyed by (name, version).
+
+    The chart, values and manifest of a revision never change once tiller
+    wrote it, so entries never expire; only the revision's status does, so
+    use get_release_status for that. The cache is sized by the serialized
+    bytes it holds. With a `directory`, revisions are also kept on disk
+    (without a size bound) and survive the process. Disk errors only make
+    lookups miss.
+    """
+
+    _logger = logger.get_logger('RevisionCache')
+
+    def __init__(self, max_bytes=REVISION_CACHE_MAX_BYTES, directory=None):
+        self._max_bytes = max_bytes
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._revisions = OrderedDict()
+        self._size = 0
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @property
+    def size(self):
+        return self._size
+
+    def _path(self, name, version):
+        return os.path.join(self._directory, '%s.%d.release' % (name, version))
+
+    def get(self, name, version):
+        """
+        Return a cached revision, or None
+        """
+        with self._lock:
+            data = self._revisions.pop((name, version), None)
+            if data is not None:
+                self._revisions[(name, version)] = data
+
+        if data is None and self._directory:
+            try:
+                with open(self._path(name, version), 'rb') as fobj:
+                    data = fobj.read()
+            except (IOError, OSError):
+                return None
+            self._remember(name, version, data)
+
+        return Release.FromString(data) if data is not None else None
+
+    def put(self, release):
+        """
+        Cache a revision
+        """
+        data = release.SerializeToString()
+        self._remember(release.name, release.version, data)
+
+        if self._directory:
+            path = self._path(release.name, release.version)
+            if not os.path.exists(path):
+                self._write(path, data)
+
+    def _write(self, path, data):
+        # Every writer has its own temporary file, renamed into place, so
+        # that readers never see a partially written revision
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fobj:
+                fobj.write(data)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as error:
+            self._logger.warning("Couldn't write revision %s: %s", path, error)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _remember(self, name, version, data):
+        if len(data) > self._max_bytes:
+            return
+
+        with self._lock:
+            previous = self._revisions.pop((name, version), None)
+            if previous is not None:
+                self._size -= len(previous)
+
+            self._revisions[(name, version)] = data
+            self._size += len(data)
+
+            while self._size > self._max_bytes:
+                _, evicted = self._revisions.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class ApplyResult(object):
+    """
+    The outcome of a single release operation run by Tiller.apply_many
+    """
+
+    def __init__(self, spec, response=None, error=None):
+        self.spec = spec
+        self.response = response
+        self.error = error
+
+    @property
+    def name(self):
+        return self.spec.get('name')
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<ApplyResult %s %s>' % (self.name, 'ok' if self.ok else 'failed: %s' % self.error)
 
 
 class Tiller(object):
@@ -28,18 +612,57 @@ class Tiller(object):
 
     _logger = logger.get_logger('Tiller')
 
-    def __init__(self, host, port=TILLER_PORT, timeout=TILLER_TIMEOUT, tls_config=None):
-        # init k8s connectivity
+    def __init__(self, host, port=TILLER_PORT, timeout=TILLER_TIMEOUT, tls_config=None,
+                 release_cache=None, revision_cache=None, interceptors=None,
+                 retry_policy=DEFAULT_RETRY_POLICY, write_retry_policy=None,
+                 coalesce_reads=False, load_balancing=ROUND_ROBIN,
+                 health_check_interval=HEALTH_CHECK_INTERVAL, compression=None):
+        # init k8s connectivity, `host` being either a single host or a list
+        # of "host[:port]" endpoints served by a ChannelPool
         self._host = host
         self._port = port
         self._tls_config = tls_config
+        self._load_balancing = load_balancing
+        self._health_check_interval = health_check_interval
+
+        # optional compression ("gzip" or "deflate") of all the requests,
+        # which write methods can also set per call
+        self._compression = compression_algorithm(compression)
 
-        # init tiller channel
-        self._channel = self.get_channel()
+        # init tiller channel, wrapped by the client interceptors (the first
+        # one being the outermost) and shared by all the requests. Read-only
+        # calls are retried by default, writes only with a write_retry_policy.
+        # With coalesce_reads, concurrent identical reads share a single call.
+        self._interceptors = list(interceptors or [])
+        if coalesce_reads:
+            self._interceptors.append(CoalescingInterceptor())
+        if retry_policy is not None or write_retry_policy is not None:
+            self._interceptors.append(RetryInterceptor(read_policy=retry_policy,
+                                                       write_policy=write_retry_policy))
+        # The channel and its stubs are only created by the first call, so
+        # building a Tiller doesn't connect nor read the TLS files. They are
+        # created again by the first call made after a fork.
+        self._connection = None
+        self._connection_lock = threading.Lock()
+
+        # time of the last successful wait_ready(), None after a failed one
+        self._ready = None
 
         # init timeout for all requests
         self._timeout = timeout
 
+        # optional ReleaseCache serving listings and status lookups
+        self._release_cache = release_cache
+
+        # optional RevisionCache serving versioned content lookups
+        self._revision_cache = revision_cache
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     @property
     def metadata(self):
         """
@@ -47,23 +670,80 @@ class Tiller(object):
         """
         return [(b'x-helm-api-client', TILLER_VERSION)]
 
+    def close(self):
+        """
+        Close the channel, or the channel pool and its health checks,
+        cancelling in-flight calls. A later call connects again.
+        """
+        with self._connection_lock:
+            connection, self._connection = self._connection, None
+            self._ready = None
+        # A channel inherited from the parent process is only dropped
+        if connection is not None and connection[3] == os.getpid():
+            connection[0].close()
+
+    @property
+    def _channel(self):
+        return self._connect()[0]
+
+    @property
+    def _stub(self):
+        return self._connect()[1]
+
+    @property
+    def _splicing_stub(self):
+        return self._connect()[2]
+
+    def _connect(self):
+        """
+        Return the (channel, stub, splicing stub) of this Tiller, creating
+        them on first use in every process
+        """
+        pid = os.getpid()
+        connection = self._connection
+        if connection is not None and connection[3] != pid:
+            # Forked since the channel was created: the parent's channel can't
+            # be used in this process, and its lock may have been held by a
+            # thread that doesn't exist here
+            self._logger.debug('Reconnecting to tiller after fork (pid %s)', pid)
+            if not fork_supported():
+                self._logger.warning('grpcio %s may fail to reconnect after fork, '
+                                     'grpcio>=%s is needed', grpc.__version__,
+                                     '.'.join(map(str, FORK_MIN_GRPCIO_VERSION)))
+            self._connection_lock = threading.Lock()
+            self._connection = connection = self._ready = None
+
+        if connection is None:
+            with self._connection_lock:
+                if self._connection is None:
+                    channel = self.get_channel()
+                    if self._interceptors:
+                        channel = grpc.intercept_channel(channel, *self._interceptors)
+                    self._connection = (channel, ReleaseServiceStub(channel),
+                                        _SplicingStub(channel), pid)
+                connection = self._connection
+        return connection
+
     def get_channel(self):
         """
-        Return a tiller channel
+        Return a tiller channel, pooling the endpoints when given several
         """
+        if isinstance(self._host, (list, tuple)):
+            return ChannelPool([(endpoint, self._endpoint_channel(endpoint))
+                                for endpoint in self._host],
+                               policy=self._load_balancing,
+                               health_check_interval=self._health_check_interval,
+                               metadata=self.metadata)
 
-        target = '%s:%s' % (self._host, self._port)
+        return self._endpoint_channel(self._host)
 
-        # Despite Helm sets grpc keep alive to 30 seconds, it handles grpc "too_many_pings" errors
-        # which we don't want to handle. Setting it to 30 seconds will cause such an error at times.
-        options = (
-            ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
-            ("grpc.http2.min_time_between_pings_ms", GRPC_MIN_TIME_BETWEEN_PINGS_MS),
-            ("grpc.http2.max_pings_without_data", 0),
-            ("grpc.keepalive_permit_without_calls", 1),
-            ("grpc.max_receive_message_length", GRPC_MAX_RECEIVE_MESSAGE_LENGTH),
-            ("grpc.max_send_message_length", GRPC_MAX_SEND_MESSAGE_LENGTH)
-        )
+    def _endpoint_channel(self, endpoint):
+        """
+        Return a channel to a "host[:port]" endpoint
+        """
+
+        target = endpoint if ':' in endpoint else '%s:%s' % (endpoint, self._port)
+        options = GRPC_CHANNEL_OPTIONS
 
         if self._tls_config:
             ssl_channel_credentials = grpc.ssl_channel_credentials(
@@ -72,48 +752,118 @@ class Tiller(object):
                 certificate_chain=self._tls_config.cert_data
             )
 
-            return grpc.secure_channel(target, ssl_channel_credentials, options=options)
+            return grpc.secure_channel(target, ssl_channel_credentials, options=options,
+                                       compression=self._compression)
         else:
-            return grpc.insecure_channel(target, options=options)
+            return grpc.insecure_channel(target, options=options,
+                                         compression=self._compression)
 
-    def tiller_status(self):
+    def wait_ready(self, timeout=READY_TIMEOUT, refresh=False):
         """
-        return if tiller exist or not
+        Wait for tiller to be reachable, and return whether it is
+
+        The channel must get to the READY connectivity state, then tiller
+        must answer a GetVersion call, both within `timeout` seconds. A
+        success is cached for READY_CACHE_TTL seconds, unless `refresh`;
+        failures aren't, so every call waits until tiller is ready.
         """
-        if self._host:
+        if not refresh and self._ready is not None and \
+                time.time() - self._ready < READY_CACHE_TTL:
             return True
 
+        deadline = time.time() + timeout
+        try:
+            grpc.channel_ready_future(self._channel).result(timeout=timeout)
+            self._stub.GetVersion(GetVersionRequest(),
+                                  max(deadline - time.time(), 0),
+                                  metadata=self.metadata)
+            ready = True
+        except (grpc.FutureTimeoutError, grpc.RpcError):
+            self._logger.warning("Tiller %s isn't ready after %s seconds", self._host, timeout)
+            ready = False
+
+        self._ready = time.time() if ready else None
+        return ready
+
+    def tiller_status(self, timeout=READY_TIMEOUT):
+        """
+        return if tiller exist or not, i.e. answers within timeout seconds
+        """
+        if self._host:
+            return self.wait_ready(timeout)
+
         return False
 
-    def list_releases(self, status_codes=None, namespace=""):
+    def list_releases(self, status_codes=None, namespace="", filter="",
+                      sort_by=None, sort_order=None, limit=RELEASE_LIMIT,
+                      summary=False):
         """
         List Helm Releases
 
-        Possible status codes can be seen in the status_pb2 in part of Helm gRPC definition
+        Possible status codes can be seen in the status_pb2 in part of Helm gRPC definition.
+        See iter_releases for the filtering and sorting options.
         """
-        releases = []
+        return list(self.iter_releases(status_codes=status_codes,
+                                       namespace=namespace,
+                                       filter=filter,
+                                       sort_by=sort_by,
+                                       sort_order=sort_order,
+                                       limit=limit,
+                                       summary=summary))
 
-        # Convert the string status codes to the their numerical values
-        if status_codes:
-            codes_enum = _STATUS.enum_types_by_name.get("Code")
-            request_status_codes = [codes_enum.values_by_name.get(code).number for code in status_codes]
-        else:
-            request_status_codes = []
+    def iter_releases(self, status_codes=None, namespace="", filter="",
+                      sort_by=None, sort_order=None, limit=RELEASE_LIMIT,
+                      summary=False):
+        """
+        Lazily iterate over Helm Releases
 
-        offset = None
-        stub = ReleaseServiceStub(self._channel)
+        :params - filter - regular expression tiller matches release names against
+        :params - sort_by - ListSort.SortBy name: NAME, LAST_RELEASED or CHART_NAME
+        :params - sort_order - ListSort.SortOrder name: ASC or DESC
+        :params - limit - number of releases fetched per page
+        :params - summary - yield ReleaseSummary objects instead of full releases
+
+        Releases are yielded as each page arrives from tiller, and a page is
+        dropped once all its releases were consumed, so memory usage doesn't
+        grow with the number of releases. In summary mode a page is projected
+        as soon as it arrives so the full releases are never kept around.
+
+        When the Tiller has a ReleaseCache, unfiltered listings are served from it.
+        """
+        if self._release_cache is not None and \
+                self._release_cache.covers(status_codes, filter, sort_by, sort_order):
+            for release in self._release_cache.releases(self, status_codes, namespace):
+                yield ReleaseSummary.from_release(release) if summary else release
+            return
+
+        # Convert the string status codes and sort options to the their numerical values
+        request_status_codes = status_code_numbers(status_codes)
+        request_sort_by = list_sort_number("SortBy", sort_by)
+        request_sort_order = list_sort_number("SortOrder", sort_order)
 
+        offset = None
         while True:
-            req = ListReleasesRequest(limit=RELEASE_LIMIT,
+            req = ListReleasesRequest(limit=limit,
                                       offset=offset,
                                       namespace=namespace,
-                                      status_codes=request_status_codes)
-            release_list = stub.ListReleases(req, self._timeout,
-                                             metadata=self.metadata)
+                                      status_codes=request_status_codes,
+                                      filter=filter,
+                                      sort_by=request_sort_by,
+                                      sort_order=request_sort_order)
+            release_list = self._stub.ListReleases(req, self._timeout,
+                                                   metadata=self.metadata)
+
+            for page in release_list:
+                offset = str(page.next)
+
+                if summary:
+                    releases = [ReleaseSummary.from_release(r) for r in page.releases]
+                else:
+                    releases = page.releases
+                del page
 
-            for y in release_list:
-                offset = str(y.next)
-                releases.extend(y.releases)
+                for release in releases:
+                    yield release
 
             # This handles two cases:
             # 1. If there are no releases, offset will not be set and will remain None
@@ -121,7 +871,40 @@ class Tiller(object):
             if not offset:
                 break
 
-        return releases
+    def list_releases_parallel(self, status_codes=None, namespaces=None,
+                               prefixes=None, limit=RELEASE_LIMIT, summary=False,
+                               max_workers=LIST_MAX_WORKERS):
+        """
+        :params - namespaces - list the releases of these namespaces
+        :params - prefixes - list the releases whose names start with these prefixes
+        :params - max_workers - maximum number of pagination chains run at once
+
+        List Helm Releases with one pagination chain per namespace or name
+        prefix, run concurrently over the shared channel, so that listing a
+        busy tiller isn't bound by the latency of one long chain of pages.
+
+        Without namespaces nor prefixes, releases are partitioned by the first
+        character of their name, which covers every release. Results are
+        merged, de-duplicated and sorted by name and version.
+        """
+        if namespaces:
+            chains = [dict(namespace=namespace) for namespace in namespaces]
+        elif prefixes:
+            chains = [dict(filter="^" + re.escape(prefix)) for prefix in prefixes]
+        else:
+            chains = [dict(filter="^[%s%s]" % (c, c.upper())) for c in RELEASE_NAME_PARTITIONS]
+
+        def list_chain(chain):
+            return self.list_releases(status_codes=status_codes, limit=limit,
+                                      summary=summary, **chain)
+
+        releases = {}
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for chain_releases in executor.map(list_chain, chains):
+                for release in chain_releases:
+                    releases[(release.name, release.version)] = release
+
+        return [releases[key] for key in sorted(releases)]
 
     def list_charts(self):
         """
@@ -143,77 +926,203 @@ class Tiller(object):
                        name=None, values=None, wait=False,
                        disable_hooks=False, recreate=False,
                        reset_values=False, reuse_values=False,
-                       force=False, description="", install=False):
+                       force=False, description="", install=False,
+                       skip_unchanged=False, known_releases=None,
+                       upgrade_first=False, compression=None):
         """
         Update a Helm Release
-        """
-        stub = ReleaseServiceStub(self._channel)
 
+        With install, the release is installed when it doesn't exist yet. By
+        default this is decided by a GetReleaseStatus call, unless:
+        - known_releases is given (see release_namespaces), e.g. one listing
+          prefetched for a whole batch of upserts
+        - the Tiller has a ReleaseCache
+        - upgrade_first is set, in which case the upgrade is sent right away
+          and the release is installed if tiller doesn't know it
+
+        With skip_unchanged, the upgrade is skipped when the deployed revision
+        already runs the same chart and values. The deployed release is
+        returned in an UpdateReleaseResponse in that case. Upgrades asking for
+        recreate, force, reset_values or reuse_values are never skipped.
+
+        compression ("gzip" or "deflate") compresses the chart sent to tiller,
+        overriding the Tiller's compression for this call.
+        """
         if install:
             if not namespace:
                 namespace = DEFAULT_NAMESPACE
 
-            try:
-                release_status = self.get_release_status(name)
-            except grpc.RpcError as rpc_error_call:
-                if not rpc_error_call.details() == "getting deployed release \"{}\": release: \"{}\" not found".format(name, name):
-                    raise rpc_error_call
+            if upgrade_first:
+                try:
+                    return self.update_release(chart, namespace, dry_run=dry_run,
+                                               name=name, values=values, wait=wait,
+                                               disable_hooks=disable_hooks,
+                                               recreate=recreate,
+                                               reset_values=reset_values,
+                                               reuse_values=reuse_values,
+                                               force=force, description=description,
+                                               skip_unchanged=skip_unchanged,
+                                               compression=compression)
+                except grpc.RpcError as rpc_error_call:
+                    if not release_not_found(rpc_error_call, name):
+                        raise rpc_error_call
+
+                    self._logger.info(
+                        "Release %s does not exist. Installing it now.", name)
 
-                # The release doesn't exist - it's time to install
-                self._logger.info(
-                    "Release %s does not exist. Installing it now.", name)
+                    return self.install_release(chart, namespace, dry_run,
+                                                name, values, wait,
+                                                compression=compression)
 
+            if not self._release_exists(name, namespace, known_releases):
                 return self.install_release(chart, namespace, dry_run,
-                                            name, values, wait)
+                                            name, values, wait,
+                                            compression=compression)
 
-            if release_status.namespace != namespace:
-                self._logger.warn("Namespace %s doesn't match with previous. Release will be deployed to %s",
-                                  release_status.namespace, namespace)
+        if skip_unchanged and not (recreate or force or reset_values or reuse_values):
+            unchanged = self._unchanged_release(chart, name, values)
+            if unchanged is not None:
+                return unchanged
 
-        values = Config(raw=yaml.safe_dump(values or {}))
+        release_request = self._update_request(chart, name, values, dry_run, wait,
+                                               disable_hooks, recreate, reset_values,
+                                               reuse_values, force, description)
+        self._check_payload(release_request)
 
-        release_request = UpdateReleaseRequest(
-            chart=chart,
-            dry_run=dry_run,
-            disable_hooks=disable_hooks,
-            values=values,
-            name=name or '',
-            wait=wait,
-            recreate=recreate,
-            reset_values=reset_values,
-            reuse_values=reuse_values,
-            force=force,
-            description=description)
+        try:
+            stub = self._release_stub(release_request)
+            return stub.UpdateRelease(release_request, self._timeout,
+                                      metadata=self.metadata,
+                                      compression=compression_algorithm(compression))
+        finally:
+            self._invalidate(name, dry_run)
 
-        return stub.UpdateRelease(release_request, self._timeout,
-                                  metadata=self.metadata)
+    def update_release_async(self, chart, namespace, dry_run=False,
+                             name=None, values=None, wait=False,
+                             disable_hooks=False, recreate=False,
+                             reset_values=False, reuse_values=False,
+                             force=False, description="", install=False,
+                             skip_unchanged=False, known_releases=None,
+                             timeout=None, compression=None):
+        """
+        Update a Helm Release without waiting for it
+
+        Returns a grpc.Future, which can be cancelled, given completion
+        callbacks and waited on. `timeout` is the deadline of this call,
+        defaulting to the Tiller's timeout. See update_release for the other
+        options; deciding whether to install is still done synchronously.
+        """
+        if install:
+            if not namespace:
+                namespace = DEFAULT_NAMESPACE
+
+            if not self._release_exists(name, namespace, known_releases):
+                return self.install_release_async(chart, namespace, dry_run,
+                                                  name, values, wait,
+                                                  timeout=timeout,
+                                                  compression=compression)
+
+        if skip_unchanged and not (recreate or force or reset_values or reuse_values):
+            unchanged = self._unchanged_release(chart, name, values)
+            if unchanged is not None:
+                return CompletedCall(unchanged)
+
+        release_request = self._update_request(chart, name, values, dry_run, wait,
+                                               disable_hooks, recreate, reset_values,
+                                               reuse_values, force, description)
+        self._check_payload(release_request)
+        return self._submit(self._release_stub(release_request).UpdateRelease,
+                            release_request, timeout, name, dry_run, compression)
+
+    def apply_many(self, specs, max_workers=APPLY_MAX_WORKERS, fail_fast=False,
+                   prefetch=False):
+        """
+        :params - specs - iterable of update_release keyword arguments, one per release
+        :params - max_workers - maximum number of releases applied at once
+        :params - fail_fast - stop at the first failed release instead of carrying on
+        :params - prefetch - list the existing releases once for the whole batch
+                             instead of checking each release's status
+
+        Install or upgrade many releases concurrently over the shared channel.
+        Releases are upserted (install=True) unless a spec says otherwise.
+
+        Yields an ApplyResult per release as soon as it finishes. With fail_fast,
+        releases that haven't started yet are cancelled and the first error is
+        raised once the ones already in flight are done.
+        """
+        known_releases = None
+        if prefetch:
+            known_releases = release_namespaces(
+                self.iter_releases(status_codes=ReleaseCache.STATUS_CODES, summary=True))
+
+        def apply(spec):
+            kwargs = dict(spec)
+            kwargs.setdefault('install', True)
+            if known_releases is not None:
+                kwargs.setdefault('known_releases', known_releases)
+            return self.update_release(**kwargs)
+
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = dict((executor.submit(apply, spec), spec) for spec in specs)
+
+            for future in futures.as_completed(pending):
+                spec = pending[future]
+                error = future.exception()
+
+                if error is None:
+                    yield ApplyResult(spec, response=future.result())
+                    continue
+
+                self._logger.error("Applying release %s failed: %s", spec.get('name'), error)
+
+                if fail_fast:
+                    for other in pending:
+                        other.cancel()
+                    raise error
+
+                yield ApplyResult(spec, error=error)
 
     def install_release(self, chart, namespace, dry_run=False,
                         name=None, values=None, wait=False,
                         disable_hooks=False, reuse_name=False,
-                        disable_crd_hook=False, description=""):
+                        disable_crd_hook=False, description="", compression=None):
         """
         Create a Helm Release
+
+        See update_release for compression
         """
+        release_request = self._install_request(chart, namespace, dry_run, name,
+                                                values, wait, disable_hooks,
+                                                reuse_name, disable_crd_hook,
+                                                description)
+        self._check_payload(release_request)
 
-        values = Config(raw=yaml.safe_dump(values or {}))
+        try:
+            stub = self._release_stub(release_request)
+            return stub.InstallRelease(release_request,
+                                       self._timeout,
+                                       metadata=self.metadata,
+                                       compression=compression_algorithm(compression))
+        finally:
+            self._invalidate(name, dry_run)
 
-        stub = ReleaseServiceStub(self._channel)
-        release_request = InstallReleaseRequest(
-            chart=chart,
-            dry_run=dry_run,
-            values=values,
-            name=name or '',
-            namespace=namespace,
-            wait=wait,
-            disable_hooks=disable_hooks,
-            reuse_name=reuse_name,
-            disable_crd_hook=disable_crd_hook,
-            description=description)
+    def install_release_async(self, chart, namespace, dry_run=False,
+                              name=None, values=None, wait=False,
+                              disable_hooks=False, reuse_name=False,
+                              disable_crd_hook=False, description="",
+                              timeout=None, compression=None):
+        """
+        Create a Helm Release without waiting for it
 
-        return stub.InstallRelease(release_request,
-                                   self._timeout,
-                                   metadata=self.metadata)
+        Returns a grpc.Future, see update_release_async
+        """
+        release_request = self._install_request(chart, namespace, dry_run, name,
+                                                values, wait, disable_hooks,
+                                                reuse_name, disable_crd_hook,
+                                                description)
+        self._check_payload(release_request)
+        return self._submit(self._release_stub(release_request).InstallRelease,
+                            release_request, timeout, name, dry_run, compression)
 
     def uninstall_release(self, release, disable_hooks=False, purge=True):
         """
@@ -223,35 +1132,280 @@ class Tiller(object):
         Deletes a helm chart from tiller
         """
 
-        stub = ReleaseServiceStub(self._channel)
         release_request = UninstallReleaseRequest(name=release,
                                                   disable_hooks=disable_hooks,
                                                   purge=purge)
-        return stub.UninstallRelease(release_request,
-                                     self._timeout,
-                                     metadata=self.metadata)
+        try:
+            return self._stub.UninstallRelease(release_request,
+                                               self._timeout,
+                                               metadata=self.metadata)
+        finally:
+            self._invalidate(release)
+
+    def uninstall_release_async(self, release, disable_hooks=False, purge=True,
+                                timeout=None):
+        """
+        Delete a helm chart from tiller without waiting for it
+
+        Returns a grpc.Future, see update_release_async
+        """
+        release_request = UninstallReleaseRequest(name=release,
+                                                  disable_hooks=disable_hooks,
+                                                  purge=purge)
+        return self._submit(self._stub.UninstallRelease, release_request, timeout,
+                            release)
 
     def get_release_status(self, release, version=None):
         """
         Gets a release's status
+
+        The latest status is served from the ReleaseCache when there is one
         """
-        stub = ReleaseServiceStub(self._channel)
+        if self._release_cache is not None and not version:
+            cached = self._release_cache.get(self, release)
+            if cached is not None:
+                return GetReleaseStatusResponse(name=cached.name,
+                                                info=cached.info,
+                                                namespace=cached.namespace)
+
         status_request = GetReleaseStatusRequest(name=release,
                                                  version=version)
-        return stub.GetReleaseStatus(status_request,
-                                     self._timeout,
-                                     metadata=self.metadata)
+        return self._stub.GetReleaseStatus(status_request,
+                                           self._timeout,
+                                           metadata=self.metadata)
 
     def get_release_content(self, release, version=None):
         """
         Gets a release's content
+
+        Specific versions are served from the RevisionCache when there is one
         """
-        stub = ReleaseServiceStub(self._channel)
+        if self._revision_cache is not None and version:
+            cached = self._revision_cache.get(release, version)
+            if cached is not None:
+                return GetReleaseContentResponse(release=cached)
+
         status_request = GetReleaseContentRequest(name=release,
                                                   version=version)
-        return stub.GetReleaseContent(status_request,
-                                      self._timeout,
-                                      metadata=self.metadata)
+        content = self._stub.GetReleaseContent(status_request,
+                                               self._timeout,
+                                               metadata=self.metadata)
+
+        if self._revision_cache is not None:
+            self._revision_cache.put(content.release)
+
+        return content
+
+    def get_history(self, release, max=256):
+        """
+        Gets a release's history, newest revision first
+
+        Every revision returned is added to the RevisionCache when there is one
+        """
+        history_request = GetHistoryRequest(name=release, max=max)
+        history = self._stub.GetHistory(history_request,
+                                        self._timeout,
+                                        metadata=self.metadata)
+
+        if self._revision_cache is not None:
+            for revision in history.releases:
+                self._revision_cache.put(revision)
+
+        return history
+
+    def rollback_release(self, release, version, dry_run=False,
+                         disable_hooks=False, recreate=False, wait=False,
+                         force=False, description=""):
+        """
+        Roll a Helm Release back to a previous revision
+        """
+        rollback_request = self._rollback_request(release, version, dry_run,
+                                                  disable_hooks, recreate, wait,
+                                                  force, description)
+        try:
+            return self._stub.RollbackRelease(rollback_request,
+                                              self._timeout,
+                                              metadata=self.metadata)
+        finally:
+            self._invalidate(release, dry_run)
+
+    def rollback_release_async(self, release, version, dry_run=False,
+                               disable_hooks=False, recreate=False, wait=False,
+                               force=False, description="", timeout=None):
+        """
+        Roll a Helm Release back to a previous revision without waiting for it
+
+        Returns a grpc.Future, see update_release_async
+        """
+        rollback_request = self._rollback_request(release, version, dry_run,
+                                                  disable_hooks, recreate, wait,
+                                                  force, description)
+        return self._submit(self._stub.RollbackRelease, rollback_request, timeout,
+                            release, dry_run)
+
+    def test_release(self, release, cleanup=False, parallel=False):
+        """
+        Run a release's test hooks
+
+        Returns the list of test messages streamed back by tiller
+        """
+        test_request = TestReleaseRequest(name=release,
+                                          timeout=self._timeout,
+                                          cleanup=cleanup,
+                                          parallel=parallel)
+        return list(self._stub.RunReleaseTest(test_request,
+                                              self._timeout,
+                                              metadata=self.metadata))
+
+    def _install_request(self, chart, namespace, dry_run, name, values, wait,
+                         disable_hooks, reuse_name, disable_crd_hook, description):
+        if isinstance(chart, SerializedChart):
+            return SplicedRequest(self._install_request(
+                None, namespace, dry_run, name, values, wait, disable_hooks,
+                reuse_name, disable_crd_hook, description), chart)
+
+        return InstallReleaseRequest(
+            chart=chart,
+            dry_run=dry_run,
+            values=Config(raw=yaml.safe_dump(values or {})),
+            name=name or '',
+            namespace=namespace,
+            wait=wait,
+            disable_hooks=disable_hooks,
+            reuse_name=reuse_name,
+            disable_crd_hook=disable_crd_hook,
+            description=description)
+
+    def _update_request(self, chart, name, values, dry_run, wait, disable_hooks,
+                        recreate, reset_values, reuse_values, force, description):
+        if isinstance(chart, SerializedChart):
+            return SplicedRequest(self._update_request(
+                None, name, values, dry_run, wait, disable_hooks, recreate,
+                reset_values, reuse_values, force, description), chart)
+
+        return UpdateReleaseRequest(
+            chart=chart,
+            dry_run=dry_run,
+            disable_hooks=disable_hooks,
+            values=Config(raw=yaml.safe_dump(values or {})),
+            name=name or '',
+            wait=wait,
+            recreate=recreate,
+            reset_values=reset_values,
+            reuse_values=reuse_values,
+            force=force,
+            description=description)
+
+    def _rollback_request(self, release, version, dry_run, disable_hooks,
+                          recreate, wait, force, description):
+        return RollbackReleaseRequest(name=release,
+                                      version=version,
+                                      dry_run=dry_run,
+                                      disable_hooks=disable_hooks,
+                                      recreate=recreate,
+                                      wait=wait,
+                                      force=force,
+                                      description=description)
+
+    def _release_stub(self, release_request):
+        """
+        Return the stub able to send an install or update request
+        """
+        if isinstance(release_request, SplicedRequest):
+            return self._splicing_stub
+        return self._stub
+
+    def _check_payload(self, release_request):
+        """
+        Fail before sending a release request tiller would reject as too large
+        """
+        if release_request.ByteSize() > GRPC_MAX_SEND_MESSAGE_LENGTH:
+            raise PayloadTooLargeError(PayloadReport(release_request),
+                                       GRPC_MAX_SEND_MESSAGE_LENGTH)
+
+    def _submit(self, method, request, timeout, name, dry_run=False, compression=None):
+        """
+        Send a write request as a future, invalidating caches once it's done
+        """
+        future = method.future(request,
+                               self._timeout if timeout is None else timeout,
+                               metadata=self.metadata,
+                               compression=compression_algorithm(compression))
+        future.add_done_callback(lambda _: self._invalidate(name, dry_run))
+        return future
+
+    def _release_exists(self, name, namespace, known_releases=None):
+        """
+        Return whether a release about to be upserted exists
+        """
+        exists, release_namespace = self._release_namespace(name, known_releases)
+
+        if not exists:
+            # The release doesn't exist - it's time to install
+            self._logger.info(
+                "Release %s does not exist. Installing it now.", name)
+            return False
+
+        if release_namespace is not None and release_namespace != namespace:
+            self._logger.warn("Namespace %s doesn't match with previous. Release will be deployed to %s",
+                              release_namespace, namespace)
+        return True
+
+    def _unchanged_release(self, chart, name, values):
+        """
+        Return the deployed release in an UpdateReleaseResponse if it already
+        runs this chart and values, or None
+        """
+        deployed = self._deployed_release(name)
+        if deployed is not None and \
+                release_digest(deployed.chart, yaml.safe_load(deployed.config.raw)) == \
+                release_digest(chart, values):
+            self._logger.info("Release %s is up to date. Skipping upgrade.", name)
+            return UpdateReleaseResponse(release=deployed)
+
+        return None
+
+    def _release_namespace(self, name, known_releases=None):
+        """
+        Return whether a release exists, and its namespace when known
+        """
+        if known_releases is not None:
+            known_releases = release_namespaces(known_releases)
+            return name in known_releases, known_releases.get(name)
+
+        if self._release_cache is not None:
+            cached = self._release_cache.get(self, name)
+            return cached is not None, cached.namespace if cached is not None else None
+
+        try:
+            release_status = self.get_release_status(name)
+        except grpc.RpcError as rpc_error_call:
+            if not release_not_found(rpc_error_call, name):
+                raise rpc_error_call
+            return False, None
+
+        return True, release_status.namespace
+
+    def _deployed_release(self, name):
+        """
+        Return the latest revision of a release if it is deployed, or None
+        """
+        if self._release_cache is not None:
+            release = self._release_cache.get(self, name)
+        else:
+            release = self.get_release_content(name).release
+
+        if release is None or release.info.status.code not in status_code_numbers(["DEPLOYED"]):
+            return None
+
+        return release
+
+    def _invalidate(self, name, dry_run=False):
+        """
+        Drop a release from the ReleaseCache after writing to it
+        """
+        if self._release_cache is not None and not dry_run:
+            self._release_cache.invalidate(name)
 
     def chart_cleanup(self, prefix, charts):
         """
@@ -267,7 +1421,7 @@ class Tiller(object):
             return "{}-{}".format(prefix, chart["chart"]["release_name"])
 
         valid_charts = [release_prefix(prefix, chart) for chart in charts]
-        actual_charts = [x.name for x in self.list_releases()]
+        actual_charts = [x.name for x in self.iter_releases(filter="^" + re.escape(prefix))]
         chart_diff = list(set(actual_charts) - set(valid_charts))
 
         for chart in chart_diff:
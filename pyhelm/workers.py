@@ -0,0 +1,94 @@
+import multiprocessing
+
+from pyhelm.tiller import Tiller, READY_TIMEOUT
+
+# The Tiller of the current worker process, built by _init_worker
+_tiller = None
+
+
+def _init_worker(host, tiller_kwargs, ready_timeout):
+    global _tiller
+    _tiller = Tiller(host, **tiller_kwargs)
+    if ready_timeout:
+        _tiller.wait_ready(ready_timeout)
+
+
+def _call(task):
+    function, args = task
+    return function(_tiller, *args)
+
+
+def worker_tiller():
+    """
+    Return the Tiller of the current TillerProcessPool worker
+    """
+    return _tiller
+
+
+class TillerProcessPool(object):
+    """
+    A pool of worker processes, each keeping its own Tiller, and so its own
+    warm channel, for as long as it lives, so that tasks don't pay for a
+    new connection to tiller.
+
+    Workers build their Tiller from `host` and `tiller_kwargs`, which must
+    be picklable, then wait up to `ready_timeout` seconds for tiller to be
+    reachable. Tasks are module-level functions called with the worker's
+    Tiller followed by their arguments:
+
+        def deploy(tiller, name, chart):
+            return tiller.update_release(chart, 'default', name=name, install=True)
+
+        with TillerProcessPool(TILLER_HOST, processes=4) as pool:
+            pool.map(deploy, [(name, chart) for name, chart in charts.items()])
+
+    Workers are started with the `start_method` multiprocessing start
+    method, "spawn" by default: forking a process that used gRPC isn't safe,
+    and workers don't need anything from their parent. Spawned workers
+    import the module of the tasks, so scripts must guard their entry point
+    with `if __name__ == '__main__'`.
+
+    Pre-fork servers (e.g. gunicorn) don't need it: a Tiller created in the
+    master process connects again in every worker on its first call there.
+    That needs grpcio>=1.64 (see fork_supported) once the master used gRPC:
+    older releases fail, or hang with GRPC_ENABLE_FORK_SUPPORT=1, to connect
+    from a forked child.
+    """
+
+    def __init__(self, host, processes=None, ready_timeout=READY_TIMEOUT,
+                 start_method='spawn', **tiller_kwargs):
+        context = multiprocessing.get_context(start_method)
+        self._pool = context.Pool(processes, initializer=_init_worker,
+                                  initargs=(host, tiller_kwargs, ready_timeout))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stop the workers once their tasks are done
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def apply(self, function, *args):
+        """
+        Call function(tiller, *args) in a worker and return its result
+        """
+        return self._pool.apply(_call, ((function, args),))
+
+    def apply_async(self, function, *args):
+        """
+        Call function(tiller, *args) in a worker, returning an AsyncResult
+        """
+        return self._pool.apply_async(_call, ((function, args),))
+
+    def map(self, function, arguments):
+        """
+        Call function(tiller, *args) in the workers for every tuple of
+        arguments, and return the results in order
+        """
+        return self._pool.map(_call, [(function, tuple(args)) for args in arguments])
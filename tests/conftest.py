@@ -0,0 +1,6 @@
+import sys
+
+# pyhelm.aio and its tests use async generators, which need python 3.6
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append('test_aio.py')
@@ -0,0 +1,91 @@
+from unittest import TestCase
+from unittest import mock
+
+import asyncio
+
+from supermutes.dot import dotify
+import pyhelm.aio as aio
+
+
+async def _stream(*items):
+    for item in items:
+        yield item
+
+
+def _returning(value):
+    # mock.AsyncMock needs python 3.8
+    async def coroutine(*args, **kwargs):
+        return value
+    return mock.Mock(side_effect=coroutine)
+
+
+def _run(coroutine):
+    # IsolatedAsyncioTestCase needs python 3.8
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestAsyncTiller(TestCase):
+
+    def setUp(self):
+        aio.AsyncTiller._logger = mock.Mock()
+
+    @mock.patch('pyhelm.aio.grpc')
+    def test_get_channel(self, mock_grpc):
+        aio.AsyncTiller('test')
+        mock_grpc.aio.insecure_channel.assert_called()
+
+    @mock.patch('pyhelm.aio.ReleaseServiceStub')
+    @mock.patch('pyhelm.aio.ListReleasesRequest')
+    @mock.patch('pyhelm.aio.grpc')
+    def test_list_releases(self, _0, mock_list_release_request, mock_release_service_stub):
+        mock_release_service_stub.return_value.ListReleases.side_effect = [
+            _stream(dotify({'next': 'bar', 'releases': ['foo']})),
+            _stream(dotify({'next': '', 'releases': ['bar']})),
+        ]
+        r = _run(aio.AsyncTiller('test').list_releases(status_codes=["DEPLOYED"]))
+        mock_list_release_request.assert_called_with(limit=aio.RELEASE_LIMIT, offset='bar', namespace="", status_codes=[1], filter='', sort_by=0, sort_order=0)
+        self.assertEqual(r, ['foo', 'bar'])
+
+    @mock.patch('pyhelm.aio.ReleaseServiceStub')
+    @mock.patch('pyhelm.aio.UpdateReleaseRequest')
+    @mock.patch('pyhelm.aio.grpc')
+    def test_update_release(self, _0, _1, mock_release_service_stub):
+        stub = mock_release_service_stub.return_value
+        stub.GetReleaseStatus = _returning(dotify({'namespace': 'testing'}))
+        stub.UpdateRelease = _returning(True)
+        t = _run(aio.AsyncTiller('test').update_release('foo', '', name='foo', install=True))
+        aio.AsyncTiller._logger.warn.assert_called()
+        self.assertTrue(t)
+
+    @mock.patch('pyhelm.aio.ReleaseServiceStub')
+    @mock.patch('pyhelm.aio.InstallReleaseRequest')
+    @mock.patch('pyhelm.aio.grpc')
+    def test_install_release(self, _0, _1, mock_release_service_stub):
+        mock_release_service_stub.return_value.InstallRelease = _returning(True)
+        t = _run(aio.AsyncTiller('test').install_release('foo', 'test'))
+        self.assertTrue(t)
+
+    @mock.patch('pyhelm.aio.ReleaseServiceStub')
+    @mock.patch('pyhelm.aio.grpc')
+    def test_uninstall_release(self, _0, mock_release_service_stub):
+        mock_release_service_stub.return_value.UninstallRelease = _returning(True)
+        t = _run(aio.AsyncTiller('test').uninstall_release('foo'))
+        self.assertTrue(t)
+
+    @mock.patch('pyhelm.aio.ReleaseServiceStub')
+    @mock.patch('pyhelm.aio.grpc')
+    def test_get_release_content(self, _0, mock_release_service_stub):
+        mock_release_service_stub.return_value.GetReleaseContent = _returning(True)
+        t = _run(aio.AsyncTiller('test').get_release_content('foo', 2))
+        self.assertTrue(t)
+
+    @mock.patch('pyhelm.aio.ReleaseServiceStub')
+    @mock.patch('pyhelm.aio.grpc')
+    def test_test_release(self, _0, mock_release_service_stub):
+        mock_release_service_stub.return_value.RunReleaseTest.return_value = _stream('running', 'passed')
+        t = _run(aio.AsyncTiller('test').test_release('foo'))
+        self.assertEqual(t, ['running', 'passed'])
@@ -6,6 +6,7 @@ except ImportError:
     import mock
 
 import io
+from hapi.chart.chart_pb2 import Chart
 from hapi.chart.template_pb2 import Template
 from hapi.chart.metadata_pb2 import Metadata
 from hapi.chart.config_pb2 import Config
@@ -142,6 +143,15 @@ metadata:
         cb.get_helm_chart()
         cb._logger.info.assert_called()
 
+    @mock.patch('pyhelm.chartbuilder.ChartBuilder.source_clone')
+    def test_payload_report(self, _0):
+        cb = ChartBuilder({'name': 'foo', 'source': {}})
+        cb._helm_chart = Chart(metadata=Metadata(name='foo'),
+                               templates=[Template(name='templates/big.yaml', data=b'x' * 100)])
+        report = cb.payload_report()
+        self.assertEqual(report.total, cb._helm_chart.ByteSize())
+        self.assertEqual(report.largest(1)[0][0], 'templates/big.yaml')
+
     @mock.patch('pyhelm.chartbuilder.repo')
     def test_source_cleanup(self, mock_repo):
         ChartBuilder({'name': 'foo',
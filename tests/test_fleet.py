@@ -0,0 +1,86 @@
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import threading
+import time
+
+import pyhelm.fleet as fleet
+import pyhelm.tiller as tiller
+
+
+def _tiller(releases, latency=0, error=None):
+    t = mock.Mock(spec=tiller.Tiller)
+
+    def list_releases(**kwargs):
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return releases
+
+    t.list_releases.side_effect = list_releases
+    return t
+
+
+class TestTillerFleet(TestCase):
+
+    def setUp(self):
+        fleet.TillerFleet._logger = mock.Mock()
+
+    def test_list_releases(self):
+        with fleet.TillerFleet({'a': _tiller(['foo', 'bar']), 'b': _tiller(['baz'])}) as f:
+            self.assertEqual(sorted(f.list_releases(namespace='default')),
+                             [('a', 'bar'), ('a', 'foo'), ('b', 'baz')])
+            f.tillers['a'].list_releases.assert_called_once_with(namespace='default')
+            self.assertEqual(sorted(f.latency), ['a', 'b'])
+
+    def test_close(self):
+        passed = _tiller([])
+        with mock.patch.object(tiller.Tiller, 'close') as close:
+            with fleet.TillerFleet({'a': passed, 'b': 'localhost'}) as f:
+                self.assertIsInstance(f.tillers['b'], tiller.Tiller)
+            close.assert_called_once_with()
+        passed.close.assert_not_called()
+
+    def test_concurrent(self):
+        clusters = dict(('c%d' % i, _tiller(['foo'], latency=0.2)) for i in range(8))
+        with fleet.TillerFleet(clusters) as f:
+            start = time.time()
+            self.assertEqual(len(f.list_releases()), 8)
+            self.assertLess(time.time() - start, 0.6)
+
+    def test_concurrency_cap(self):
+        running = [0, 0]
+        lock = threading.Lock()
+
+        def operation(t):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        clusters = dict(('c%d' % i, _tiller([])) for i in range(8))
+        with fleet.TillerFleet(clusters, max_workers=2) as f:
+            results = f.gather(operation)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(running[1], 2)
+
+    def test_errors(self):
+        error = RuntimeError('boom')
+        with fleet.TillerFleet({'a': _tiller(['foo']), 'b': _tiller([], error=error)}) as f:
+            results = f.gather('list_releases')
+            self.assertTrue(results['a'].ok)
+            self.assertIs(results['b'].error, error)
+            fleet.TillerFleet._logger.error.assert_called_once()
+
+            self.assertEqual(f.list_releases(), [('a', 'foo')])
+            self.assertEqual(list(r.cluster for r in f.run('list_releases', clusters=['a'])), ['a'])
+
+    def test_hosts(self):
+        with fleet.TillerFleet({'a': 'localhost'}, port=1234, retry_policy=None) as f:
+            self.assertIsInstance(f.tillers['a'], tiller.Tiller)
+            self.assertEqual(f.tillers['a']._port, 1234)
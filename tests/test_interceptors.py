@@ -0,0 +1,289 @@
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from concurrent import futures
+import threading
+import time
+import grpc
+
+from hapi.services import tiller_pb2
+from hapi.services.tiller_pb2_grpc import ReleaseServiceServicer, \
+    add_ReleaseServiceServicer_to_server
+from hapi.release.release_pb2 import Release
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.config_pb2 import Config
+from hapi.chart.metadata_pb2 import Metadata
+from hapi.chart.template_pb2 import Template
+import pyhelm.interceptors as interceptors
+import pyhelm.tiller as tiller
+
+
+class Servicer(ReleaseServiceServicer):
+    """
+    Answers status and listing calls, failing the first `failures` calls
+    with UNAVAILABLE
+    """
+
+    def __init__(self, failures=0, latency=0):
+        self.failures = failures
+        self.latency = latency
+        self.calls = []
+        self.charts = []
+
+    def _fail(self, method, context):
+        self.calls.append(method)
+        time.sleep(self.latency)
+        if self.failures:
+            self.failures -= 1
+            context.abort(grpc.StatusCode.UNAVAILABLE, 'try again')
+
+    def GetReleaseStatus(self, request, context):
+        self._fail('GetReleaseStatus', context)
+        return tiller_pb2.GetReleaseStatusResponse(name=request.name, namespace='default')
+
+    def ListReleases(self, request, context):
+        self._fail('ListReleases', context)
+        yield tiller_pb2.ListReleasesResponse(releases=[Release(name='foo')])
+
+    def UninstallRelease(self, request, context):
+        self._fail('UninstallRelease', context)
+        return tiller_pb2.UninstallReleaseResponse()
+
+    def InstallRelease(self, request, context):
+        self._fail('InstallRelease', context)
+        self.charts.append(request.chart)
+        return tiller_pb2.InstallReleaseResponse(release=Release(name=request.name))
+
+    def GetVersion(self, request, context):
+        self._fail('GetVersion', context)
+        return tiller_pb2.GetVersionResponse()
+
+
+class InterceptorTestCase(TestCase):
+
+    def setUp(self):
+        tiller.Tiller._logger = mock.Mock()
+        interceptors.RetryInterceptor._logger = mock.Mock()
+        self.servicer = Servicer()
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        add_ReleaseServiceServicer_to_server(self.servicer, self.server)
+        self.port = self.server.add_insecure_port('localhost:0')
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop(None)
+
+    def tiller(self, *interceptor_list):
+        return tiller.Tiller('localhost', port=self.port, timeout=5,
+                             interceptors=interceptor_list, retry_policy=None)
+
+
+class TestTimingInterceptor(InterceptorTestCase):
+
+    def test_timing(self):
+        callback = mock.Mock()
+        t = self.tiller(interceptors.TimingInterceptor(callback))
+        t.get_release_status('foo')
+        callback.assert_called_once_with('GetReleaseStatus', mock.ANY, grpc.StatusCode.OK)
+
+        t.list_releases()
+        callback.assert_called_with('ListReleases', mock.ANY, grpc.StatusCode.OK)
+
+    def test_timing_failure(self):
+        callback = mock.Mock()
+        self.servicer.failures = 1
+        t = self.tiller(interceptors.TimingInterceptor(callback))
+        self.assertRaises(grpc.RpcError, t.get_release_status, 'foo')
+        callback.assert_called_once_with('GetReleaseStatus', mock.ANY, grpc.StatusCode.UNAVAILABLE)
+
+
+class TestFutures(InterceptorTestCase):
+
+    def test_future(self):
+        callback = mock.Mock()
+        t = self.tiller(interceptors.TimingInterceptor(callback))
+        future = t.uninstall_release_async('foo')
+        done = threading.Event()
+        future.add_done_callback(lambda f: done.set())
+        self.assertIsInstance(future.result(), tiller_pb2.UninstallReleaseResponse)
+        self.assertTrue(done.wait(5))
+        callback.assert_called_once_with('UninstallRelease', mock.ANY, grpc.StatusCode.OK)
+
+    def test_future_deadline(self):
+        self.servicer.latency = 0.5
+        t = self.tiller()
+        future = t.uninstall_release_async('foo', timeout=0.1)
+        self.assertEqual(future.exception().code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+
+    def test_future_cancel(self):
+        self.servicer.latency = 0.5
+        t = self.tiller()
+        future = t.uninstall_release_async('foo')
+        self.assertTrue(future.cancel())
+        self.assertTrue(future.cancelled())
+
+
+class TestSerializedChart(InterceptorTestCase):
+
+    def test_install(self):
+        chart = Chart(metadata=Metadata(name='app'),
+                      templates=[Template(name='templates/a.yaml', data=b'a: 1')])
+        sizes = interceptors.RequestSizeInterceptor()
+        t = self.tiller(sizes)
+        serialized = tiller.SerializedChart(chart.SerializeToString())
+
+        self.assertEqual(t.install_release(serialized, 'default', name='foo').release.name, 'foo')
+        t.install_release_async(serialized, 'default', name='bar').result()
+        self.assertEqual(self.servicer.charts, [chart, chart])
+
+        request = tiller_pb2.InstallReleaseRequest(chart=chart, name='foo', namespace='default',
+                                                   values=Config(raw='{}\n'))
+        self.assertEqual(sizes.sizes['InstallRelease'][2], request.ByteSize())
+
+
+class TestRetryInterceptor(InterceptorTestCase):
+
+    def test_retry_reads(self):
+        self.servicer.failures = 2
+        t = self.tiller(interceptors.RetryInterceptor(interceptors.RetryPolicy(initial_backoff=0.01)))
+        self.assertEqual(t.get_release_status('foo').name, 'foo')
+
+        self.servicer.failures = 2
+        self.assertEqual([r.name for r in t.list_releases()], ['foo'])
+        self.assertEqual(self.servicer.calls.count('ListReleases'), 3)
+
+    def test_give_up(self):
+        self.servicer.failures = 3
+        t = self.tiller(interceptors.RetryInterceptor(interceptors.RetryPolicy(max_attempts=2, initial_backoff=0.01)))
+        self.assertRaises(grpc.RpcError, t.get_release_status, 'foo')
+        self.assertEqual(len(self.servicer.calls), 2)
+
+    def test_deadline_budget(self):
+        self.servicer.failures = 5
+        policy = interceptors.RetryPolicy(max_attempts=10, initial_backoff=0.2, jitter=0, deadline=0.5)
+        t = self.tiller(interceptors.RetryInterceptor(policy))
+        self.assertRaises(grpc.RpcError, t.get_release_status, 'foo')
+        # Attempts at 0, 0.2s; the next backoff (0.4s) would overrun the budget
+        self.assertEqual(len(self.servicer.calls), 2)
+
+    def test_retry_writes(self):
+        self.servicer.failures = 1
+        policy = interceptors.RetryPolicy(initial_backoff=0.01)
+        t = self.tiller(interceptors.RetryInterceptor(write_policy=policy))
+        t.uninstall_release('foo')
+        self.assertEqual(len(self.servicer.calls), 2)
+
+    def test_default_policy(self):
+        self.servicer.failures = 1
+        with mock.patch.object(interceptors.DEFAULT_RETRY_POLICY, 'initial_backoff', 0.01):
+            t = tiller.Tiller('localhost', port=self.port, timeout=5)
+            self.assertEqual(t.get_release_status('foo').name, 'foo')
+
+    def test_no_retry_writes(self):
+        self.servicer.failures = 1
+        t = self.tiller(interceptors.RetryInterceptor(interceptors.RetryPolicy(initial_backoff=0.01)))
+        self.assertRaises(grpc.RpcError, t.uninstall_release, 'foo')
+        self.assertEqual(len(self.servicer.calls), 1)
+
+
+class TestCoalescingInterceptor(InterceptorTestCase):
+
+    def _concurrently(self, fn, count=10):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fn())) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalesce(self):
+        self.servicer.latency = 0.3
+        t = self.tiller(interceptors.CoalescingInterceptor())
+        results = self._concurrently(lambda: t.get_release_status('foo').name)
+        self.assertEqual(results, ['foo'] * 10)
+        self.assertEqual(self.servicer.calls, ['GetReleaseStatus'])
+
+        results = self._concurrently(lambda: [r.name for r in t.list_releases()])
+        self.assertEqual(results, [['foo']] * 10)
+        self.assertEqual(self.servicer.calls.count('ListReleases'), 1)
+
+    def test_coalesce_errors(self):
+        self.servicer.latency = 0.3
+        self.servicer.failures = 1
+        t = tiller.Tiller('localhost', port=self.port, timeout=5, retry_policy=None, coalesce_reads=True)
+
+        def status():
+            try:
+                return t.get_release_status('foo')
+            except grpc.RpcError as rpc_error:
+                return rpc_error.code()
+
+        self.assertEqual(self._concurrently(status, 5), [grpc.StatusCode.UNAVAILABLE] * 5)
+        self.assertEqual(len(self.servicer.calls), 1)
+
+    def test_coalesce_exceptions(self):
+        coalescing = interceptors.CoalescingInterceptor()
+        details = mock.Mock(method='/hapi.services.tiller.ReleaseService/GetReleaseStatus')
+        request = tiller_pb2.GetReleaseStatusRequest(name='foo')
+        calls = []
+
+        def closed(*args):
+            calls.append(args)
+            time.sleep(0.3)
+            raise ValueError('Cannot invoke RPC on closed channel')
+
+        def status():
+            try:
+                return coalescing.intercept(closed, details, request, False)
+            except ValueError as error:
+                return str(error)
+
+        self.assertEqual(self._concurrently(status, 5), ['Cannot invoke RPC on closed channel'] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+class TestCachingInterceptor(InterceptorTestCase):
+
+    def test_caching(self):
+        t = self.tiller(interceptors.CachingInterceptor())
+        t.get_release_status('foo')
+        self.assertEqual(t.get_release_status('foo').name, 'foo')
+        t.get_release_status('bar')
+        self.assertEqual(self.servicer.calls, ['GetReleaseStatus'] * 2)
+
+        t.uninstall_release('foo')
+        t.get_release_status('foo')
+        self.assertEqual(self.servicer.calls.count('GetReleaseStatus'), 3)
+
+    def test_clear_after_write(self):
+        caching = interceptors.CachingInterceptor()
+        status = mock.Mock(method='/hapi.services.tiller.ReleaseService/GetReleaseStatus')
+        uninstall = mock.Mock(method='/hapi.services.tiller.ReleaseService/UninstallRelease')
+        request = tiller_pb2.GetReleaseStatusRequest(name='foo')
+        responses = iter(['before', 'during', 'after'])
+
+        def read(*args):
+            return interceptors.CompletedCall(next(responses))
+
+        write = caching.intercept(lambda *args: mock.Mock(), uninstall,
+                                  tiller_pb2.UninstallReleaseRequest(name='foo'), False)
+        # Reads made while the write is in flight aren't cached
+        self.assertEqual(caching.intercept(read, status, request, False).result(), 'before')
+        self.assertEqual(caching.intercept(read, status, request, False).result(), 'during')
+        write.add_done_callback.call_args[0][0](write)
+        self.assertEqual(caching.intercept(read, status, request, False).result(), 'after')
+        self.assertEqual(caching.intercept(read, status, request, False).result(), 'after')
+
+
+class TestRequestSizeInterceptor(InterceptorTestCase):
+
+    def test_sizes(self):
+        sizes = interceptors.RequestSizeInterceptor()
+        t = self.tiller(sizes)
+        t.get_release_status('foo')
+        t.get_release_status('foobar')
+        self.assertEqual(sizes.sizes['GetReleaseStatus'], (2, 13, 8))
@@ -0,0 +1,55 @@
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import grpc
+
+from test_interceptors import InterceptorTestCase
+import pyhelm.metrics as metrics
+
+
+class TestTillerMetrics(TestCase):
+
+    def test_observe(self):
+        callback = mock.Mock()
+        m = metrics.TillerMetrics(callback=callback)
+        m.observe('InstallRelease', 0.2, grpc.StatusCode.OK, 2048, 100, 1, wait=True)
+        m.observe('InstallRelease', 3, grpc.StatusCode.UNAVAILABLE, 2048)
+
+        latency = m.latency[('InstallRelease', 'true')]
+        self.assertEqual(latency.count, 1)
+        self.assertEqual(m.request_bytes['InstallRelease'].count, 2)
+        self.assertEqual(m.calls, {('InstallRelease', 'OK'): 1, ('InstallRelease', 'UNAVAILABLE'): 1})
+        callback.assert_called_with({'method': 'InstallRelease', 'seconds': 3, 'code': 'UNAVAILABLE',
+                                     'wait': False, 'request_bytes': 2048, 'response_bytes': 0,
+                                     'responses': 0})
+
+    def test_to_prometheus(self):
+        m = metrics.TillerMetrics(latency_buckets=(0.1, 1))
+        m.observe('GetReleaseStatus', 0.5, grpc.StatusCode.OK, 10, 20, 1)
+        text = m.to_prometheus()
+        self.assertIn('# TYPE pyhelm_tiller_request_duration_seconds histogram', text)
+        self.assertIn('pyhelm_tiller_request_duration_seconds_bucket{le="0.1",method="GetReleaseStatus",wait="false"} 0', text)
+        self.assertIn('pyhelm_tiller_request_duration_seconds_bucket{le="1.0",method="GetReleaseStatus",wait="false"} 1', text)
+        self.assertIn('pyhelm_tiller_request_duration_seconds_count{method="GetReleaseStatus",wait="false"} 1', text)
+        self.assertIn('pyhelm_tiller_request_bytes_max{method="GetReleaseStatus"} 10', text)
+        self.assertIn('pyhelm_tiller_calls_total{code="OK",method="GetReleaseStatus"} 1', text)
+
+
+class TestMetricsInterceptor(InterceptorTestCase):
+
+    def test_interceptor(self):
+        m = metrics.TillerMetrics()
+        t = self.tiller(metrics.MetricsInterceptor(m))
+        t.get_release_status('foo')
+        t.list_releases()
+        self.servicer.failures = 1
+        self.assertRaises(grpc.RpcError, t.get_release_status, 'foo')
+
+        self.assertEqual(m.calls, {('GetReleaseStatus', 'OK'): 1, ('GetReleaseStatus', 'UNAVAILABLE'): 1,
+                                   ('ListReleases', 'OK'): 1})
+        self.assertEqual(m.responses, {'GetReleaseStatus': 1, 'ListReleases': 1})
+        self.assertEqual(m.request_bytes['GetReleaseStatus'].max, 5)
+        self.assertGreater(m.response_bytes['ListReleases'].sum, 0)
@@ -0,0 +1,117 @@
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import time
+import grpc
+
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.metadata_pb2 import Metadata
+from hapi.release.release_pb2 import Release
+from hapi.release.status_pb2 import Status
+import pyhelm.pool as pool
+import pyhelm.tiller as tiller
+from pyhelm.testing import FakeTiller
+
+
+class TestChannelPool(TestCase):
+
+    def setUp(self):
+        tiller.Tiller._logger = mock.Mock()
+        pool.ChannelPool._logger = mock.Mock()
+        release = Release(name='foo', namespace='default', version=1)
+        release.info.status.code = Status.DEPLOYED
+        self.fakes = [FakeTiller(releases=[release], max_workers=4).start() for _ in range(3)]
+        self.endpoints = ['localhost:%d' % fake.port for fake in self.fakes]
+
+    def tearDown(self):
+        for fake in self.fakes:
+            fake.stop()
+
+    def tiller(self, **kwargs):
+        kwargs.setdefault('health_check_interval', None)
+        return tiller.Tiller(self.endpoints, timeout=5, retry_policy=None, **kwargs)
+
+    def test_round_robin(self):
+        t = self.tiller()
+        for _ in range(6):
+            t.get_release_status('foo')
+        self.assertEqual([len(f.calls) for f in self.fakes], [2, 2, 2])
+
+        self.assertEqual([r.name for r in t.list_releases()], ['foo'])
+        self.assertEqual([e.outstanding for e in t._channel.endpoints], [0, 0, 0])
+
+    def test_least_outstanding(self):
+        channels = [(endpoint, grpc.insecure_channel(endpoint)) for endpoint in self.endpoints]
+        p = pool.ChannelPool(channels, policy=pool.LEAST_OUTSTANDING,
+                             health_check_interval=None)
+        first = p.acquire()
+        second = p.acquire()
+        third = p.acquire()
+        self.assertEqual(len(set([first, second, third])), 3)
+
+        p.release(second, grpc.StatusCode.OK)
+        self.assertIs(p.acquire(), second)
+        p.close()
+
+    def test_future(self):
+        t = self.tiller(load_balancing=pool.LEAST_OUTSTANDING)
+        calls = [t.uninstall_release_async('foo') for _ in range(3)]
+        for call in calls:
+            call.result()
+        self.assertEqual([len(f.calls) for f in self.fakes], [1, 1, 1])
+
+    def test_failover(self):
+        self.fakes[1].stop()
+        t = self.tiller()
+        for _ in range(6):
+            self.assertEqual(t.get_release_status('foo').name, 'foo')
+        self.assertEqual(len(self.fakes[1].calls), 0)
+        self.assertEqual(sum(len(f.calls) for f in self.fakes), 6)
+        self.assertEqual([e.healthy for e in t._channel.endpoints], [True, False, True])
+
+    def test_no_write_failover(self):
+        self.fakes[0].stop()
+        t = self.tiller()
+        self.assertRaises(grpc.RpcError, t.uninstall_release, 'foo')
+        t.uninstall_release('foo')
+        self.assertEqual(sum(len(f.calls) for f in self.fakes), 1)
+
+    def test_health_check(self):
+        t = self.tiller()
+        self.fakes[2].fail('GetVersion')
+        t._channel.check_health()
+        self.assertEqual([e.healthy for e in t._channel.endpoints], [True, True, False])
+
+        t._channel.check_health()
+        self.assertEqual([e.healthy for e in t._channel.endpoints], [True, True, True])
+        pool.ChannelPool._logger.info.assert_called()
+
+    def test_health_check_thread(self):
+        self.fakes[0].stop()
+        t = self.tiller(health_check_interval=0.05)
+        for _ in range(100):
+            if not t._channel.endpoints[0].healthy:
+                break
+            time.sleep(0.05)
+        self.assertFalse(t._channel.endpoints[0].healthy)
+        t._channel.close()
+
+    def test_serialized_chart(self):
+        chart = Chart(metadata=Metadata(name='app', version='1.0.0'))
+        with FakeTiller() as fake:
+            t = tiller.Tiller(['localhost:%d' % fake.port], timeout=5, retry_policy=None,
+                              health_check_interval=None)
+            t.install_release(chart, 'default', name='a')
+            t.install_release(tiller.SerializedChart(chart), 'default', name='b')
+            self.assertEqual(fake.releases('b')[0].chart, chart)
+
+    def test_close(self):
+        with self.tiller(health_check_interval=0.05) as t:
+            channel = t._channel
+            t.get_release_status('foo')
+        channel._health_checker.join(5)
+        self.assertFalse(channel._health_checker.is_alive())
+        self.assertIsNone(t._connection)
@@ -0,0 +1,78 @@
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import io
+import os
+import shutil
+import tempfile
+import time
+import grpc
+
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.metadata_pb2 import Metadata
+import pyhelm.tiller as tiller
+from pyhelm.recording import Exchange, RecordingInterceptor, read_exchanges, write_exchange
+from pyhelm.testing import FakeTiller, ReplayTiller
+
+
+class TestRecording(TestCase):
+
+    def setUp(self):
+        tiller.Tiller._logger = mock.Mock()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tiller.rec')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_exchanges(self):
+        stream = io.BytesIO()
+        exchanges = [Exchange(method='ListReleases', responses=[b'x' * 300, b'y']),
+                     Exchange(method='GetVersion', code=14, details='down')]
+        for exchange in exchanges:
+            write_exchange(stream, exchange)
+
+        self.assertEqual(list(read_exchanges(io.BytesIO(stream.getvalue()))), exchanges)
+        self.assertRaises(ValueError, list, read_exchanges(io.BytesIO(stream.getvalue()[:-1])))
+
+    def test_record_and_replay(self):
+        chart = Chart(metadata=Metadata(name='app', version='1.0.0'))
+        with FakeTiller(latency={'GetReleaseStatus': 0.2}) as fake:
+            with RecordingInterceptor(self.path) as recorder:
+                t = fake.tiller(interceptors=[recorder], retry_policy=None)
+                t.install_release(chart, 'default', name='foo')
+                t.install_release(chart, 'default', name='bar')
+                recorded_releases = t.list_releases()
+                recorded_status = t.get_release_status('foo')
+                self.assertRaises(grpc.RpcError, t.get_release_content, 'missing')
+
+        with open(self.path, 'rb') as recording:
+            self.assertEqual([e.method for e in read_exchanges(recording)],
+                             ['InstallRelease', 'InstallRelease', 'ListReleases',
+                              'GetReleaseStatus', 'GetReleaseContent'])
+
+        with ReplayTiller(self.path) as replay:
+            t = replay.tiller(retry_policy=None)
+            self.assertEqual(t.list_releases(), recorded_releases)
+
+            start = time.time()
+            self.assertEqual(t.get_release_status('foo'), recorded_status)
+            self.assertGreaterEqual(time.time() - start, 0.2)
+
+            with self.assertRaises(grpc.RpcError) as raised:
+                t.get_release_content('missing')
+            self.assertTrue(tiller.release_not_found(raised.exception, 'missing'))
+
+            # Requests that weren't recorded get the method's recordings in turn
+            self.assertEqual(t.install_release(chart, 'other', name='baz').release.name, 'foo')
+            with self.assertRaises(grpc.RpcError) as raised:
+                t.get_history('foo')
+            self.assertEqual(raised.exception.code(), grpc.StatusCode.UNIMPLEMENTED)
+
+        with ReplayTiller(self.path, speed=0) as replay:
+            start = time.time()
+            replay.tiller(retry_policy=None).get_release_status('foo')
+            self.assertLess(time.time() - start, 0.2)
@@ -0,0 +1,73 @@
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import time
+import grpc
+
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.metadata_pb2 import Metadata
+from hapi.services.tiller_pb2 import GetVersionRequest
+from pyhelm.interceptors import RetryPolicy
+import pyhelm.tiller as tiller
+from pyhelm.testing import FakeTiller
+
+
+class TestFakeTiller(TestCase):
+
+    def setUp(self):
+        tiller.Tiller._logger = mock.Mock()
+        self.fake = FakeTiller().start()
+        self.tiller = self.fake.tiller(retry_policy=None, timeout=5)
+        self.chart = Chart(metadata=Metadata(name='app', version='1.0.0'))
+
+    def tearDown(self):
+        self.fake.stop()
+
+    def test_release_lifecycle(self):
+        self.tiller.update_release(self.chart, 'default', name='foo', values={'a': 1}, install=True)
+        self.tiller.update_release(self.chart, 'default', name='foo', values={'a': 2}, install=True)
+        self.assertEqual(self.tiller.get_release_status('foo').info.status.code, 1)
+        self.assertEqual([r.version for r in self.tiller.get_history('foo').releases], [2, 1])
+        self.assertEqual(self.tiller.get_release_content('foo', version=1).release.config.raw, 'a: 1\n')
+
+        release = self.tiller.rollback_release('foo', 1).release
+        self.assertEqual((release.version, release.config.raw), (3, 'a: 1\n'))
+        self.assertEqual([r.name for r in self.tiller.list_releases()], ['foo'])
+        self.assertEqual(len(self.tiller.list_releases(status_codes=['DEPLOYED', 'SUPERSEDED'])), 3)
+        self.assertEqual(len(self.tiller.test_release('foo')), 2)
+
+        self.tiller.uninstall_release('foo')
+        self.assertEqual(self.tiller.list_releases(), [])
+        with self.assertRaises(grpc.RpcError) as raised:
+            self.tiller.get_release_status('foo')
+        self.assertTrue(tiller.release_not_found(raised.exception, 'foo'))
+
+    def test_pagination(self):
+        self.fake.page_size = 3
+        for i in range(20):
+            self.tiller.install_release(self.chart, 'ns-%d' % (i % 2), name='release-%02d' % i)
+
+        releases = self.tiller.list_releases(limit=7)
+        self.assertEqual([r.name for r in releases], ['release-%02d' % i for i in range(20)])
+        # 3 pages of up to 7 releases
+        self.assertEqual(self.fake.calls.count('ListReleases'), 3)
+
+        self.assertEqual(len(self.tiller.list_releases(namespace='ns-1')), 10)
+        self.assertEqual(len(self.tiller.list_releases(filter='^release-1')), 10)
+        self.assertEqual(self.tiller.list_releases(sort_order='DESC', limit=1)[0].name, 'release-19')
+
+    def test_latency(self):
+        self.fake.latency = {'GetVersion': 0.2}
+        start = time.time()
+        self.tiller._stub.GetVersion(GetVersionRequest())
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_failures(self):
+        self.fake.fail('ListReleases', times=2)
+        self.assertRaises(grpc.RpcError, self.tiller.list_releases)
+        retrying = self.fake.tiller(retry_policy=RetryPolicy(initial_backoff=0.01))
+        self.assertEqual(retrying.list_releases(), [])
+        self.assertEqual(self.fake.calls.count('ListReleases'), 3)
@@ -1,4 +1,11 @@
+import grpc
+import re
 import pytest
+import shutil
+import os
+import tempfile
+import threading
+import time
 from unittest import TestCase
 try:
     from unittest import mock
@@ -6,8 +13,18 @@ except ImportError:
     import mock
 
 from supermutes.dot import dotify
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.metadata_pb2 import Metadata
+from hapi.chart.template_pb2 import Template
+from hapi.release.release_pb2 import Release
+from hapi.services.tiller_pb2 import ListReleasesResponse, GetHistoryResponse, \
+    GetReleaseContentResponse, InstallReleaseRequest, UpdateReleaseRequest
+from hapi.chart.config_pb2 import Config
+from google.protobuf.any_pb2 import Any
+import pyhelm.interceptors as interceptors
 import pyhelm.tiller as tiller
 import pyhelm.tls as tls
+from pyhelm.testing import FakeTiller
 
 
 class TestTiller(TestCase):
@@ -17,15 +34,48 @@ class TestTiller(TestCase):
 
     @mock.patch('pyhelm.tiller.grpc')
     def test_get_channel(self, mock_grpc):
-        tiller.Tiller('test')
-        mock_grpc.insecure_channel.assert_called()
+        t = tiller.Tiller('test')
+        mock_grpc.insecure_channel.assert_not_called()
+        t._stub
+        t._splicing_stub
+        mock_grpc.insecure_channel.assert_called_once()
 
     @mock.patch('pyhelm.tiller.grpc')
     def test_get_channel_secure(self, mock_grpc):
         mock_tls = mock.MagicMock(name='tls_config', spec=tls.TlsConfig)
-        tiller.Tiller('test', tls_config=mock_tls)
+        t = tiller.Tiller('test', tls_config=mock_tls)
+        mock_grpc.ssl_channel_credentials.assert_not_called()
+        t._stub
         mock_grpc.secure_channel.assert_called()
 
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    def test_compression(self, mock_release_service_stub):
+        stub = mock_release_service_stub.return_value
+        with mock.patch('pyhelm.tiller.grpc.insecure_channel') as mock_insecure_channel:
+            t = tiller.Tiller('test', compression='gzip', retry_policy=None)
+            t.install_release(Chart(), 'default', compression='deflate')
+        self.assertEqual(mock_insecure_channel.call_args[1]['compression'], grpc.Compression.Gzip)
+        self.assertEqual(stub.InstallRelease.call_args[1]['compression'], grpc.Compression.Deflate)
+
+        t.update_release(Chart(), 'default', name='foo')
+        self.assertIsNone(stub.UpdateRelease.call_args[1]['compression'])
+
+        self.assertRaises(ValueError, tiller.Tiller, 'test', compression='brotli')
+
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_get_channel_intercepted(self, mock_grpc):
+        interceptor = mock.Mock()
+        tiller.Tiller('test', interceptors=[interceptor], retry_policy=None)._stub
+        mock_grpc.intercept_channel.assert_called_once_with(
+            mock_grpc.insecure_channel.return_value, interceptor)
+
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_get_channel_retry(self, mock_grpc):
+        tiller.Tiller('test')._stub
+        args = mock_grpc.intercept_channel.call_args[0]
+        self.assertEqual(len(args), 2)
+        self.assertIsInstance(args[1], interceptors.RetryInterceptor)
+
     @mock.patch('pyhelm.tiller.grpc')
     def test_tiller_status(self, _0):
         t1 = tiller.Tiller('')
@@ -33,6 +83,38 @@ class TestTiller(TestCase):
         t2 = tiller.Tiller('test')
         self.assertTrue(t2.tiller_status())
 
+    def test_wait_ready(self):
+        with FakeTiller() as fake:
+            t = fake.tiller()
+            self.assertTrue(t.wait_ready())
+            self.assertEqual(fake.calls, ['GetVersion'])
+
+            # A success is cached
+            fake.stop()
+            self.assertTrue(t.wait_ready())
+            self.assertFalse(t.wait_ready(timeout=0.5, refresh=True))
+            self.assertEqual(fake.calls, ['GetVersion'])
+
+            # A failure isn't: the next call waits again
+            start = time.time()
+            self.assertFalse(t.tiller_status(timeout=0.5))
+            self.assertGreaterEqual(time.time() - start, 0.4)
+
+    def test_wait_ready_after_failure(self):
+        fake = FakeTiller()
+        t = fake.tiller()
+        self.assertFalse(t.wait_ready(timeout=0.5))
+        fake.start()
+        try:
+            self.assertTrue(t.wait_ready(timeout=10))
+        finally:
+            fake.stop()
+
+    def test_wait_ready_unavailable(self):
+        with FakeTiller() as fake:
+            fake.fail('GetVersion', code=grpc.StatusCode.UNAVAILABLE, times=10)
+            t = fake.tiller(retry_policy=None)
+            self.assertFalse(t.wait_ready())
 
 
     @mock.patch('pyhelm.tiller.ReleaseServiceStub')
@@ -43,7 +125,7 @@ class TestTiller(TestCase):
             dotify({'next': '', 'releases': ['foo']})
         ]
         r = tiller.Tiller('test').list_releases()
-        mock_list_release_request.assert_called_with(limit=tiller.RELEASE_LIMIT, offset=None, namespace="", status_codes=[])
+        mock_list_release_request.assert_called_with(limit=tiller.RELEASE_LIMIT, offset=None, namespace="", status_codes=[], filter='', sort_by=0, sort_order=0)
         mock_release_service_stub.return_value.ListReleases.assert_called()
         self.assertEqual(len(r), 1)
         self.assertEqual(r[0], 'foo')
@@ -56,7 +138,7 @@ class TestTiller(TestCase):
             dotify({'next': '', 'releases': ['foo']})
         ]
         r = tiller.Tiller('test').list_releases(namespace="test")
-        mock_list_release_request.assert_called_with(limit=tiller.RELEASE_LIMIT, offset=None, namespace="test", status_codes=[])
+        mock_list_release_request.assert_called_with(limit=tiller.RELEASE_LIMIT, offset=None, namespace="test", status_codes=[], filter='', sort_by=0, sort_order=0)
         mock_release_service_stub.return_value.ListReleases.assert_called()
         self.assertEqual(len(r), 1)
         self.assertEqual(r[0], 'foo')
@@ -70,11 +152,87 @@ class TestTiller(TestCase):
         ]
         r = tiller.Tiller('test').list_releases(status_codes=["DEPLOYED", "FAILED"])
         # See status code enum definition in hapi/status_pb2.py
-        mock_list_release_request.assert_called_with(limit=tiller.RELEASE_LIMIT, offset=None, namespace="", status_codes=[1, 4])
+        mock_list_release_request.assert_called_with(limit=tiller.RELEASE_LIMIT, offset=None, namespace="", status_codes=[1, 4], filter='', sort_by=0, sort_order=0)
         mock_release_service_stub.return_value.ListReleases.assert_called()
         self.assertEqual(len(r), 1)
         self.assertEqual(r[0], 'foo')
 
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.ListReleasesRequest')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_list_releases_with_filter_and_sort(self, _0, mock_list_release_request, mock_release_service_stub):
+        mock_release_service_stub.return_value.ListReleases.return_value = [
+            dotify({'next': '', 'releases': ['foo']})
+        ]
+        r = tiller.Tiller('test').list_releases(filter="^foo", sort_by="LAST_RELEASED",
+                                                sort_order="DESC", limit=256)
+        # See ListSort enum definitions in hapi/services/tiller_pb2.py
+        mock_list_release_request.assert_called_with(limit=256, offset=None, namespace="", status_codes=[],
+                                                     filter="^foo", sort_by=2, sort_order=1)
+        self.assertEqual(r, ['foo'])
+
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.ListReleasesRequest')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_iter_releases(self, _0, mock_list_release_request, mock_release_service_stub):
+        mock_release_service_stub.return_value.ListReleases.side_effect = [
+            [dotify({'next': 'bar', 'releases': ['foo']})],
+            [dotify({'next': '', 'releases': ['bar', 'baz']})],
+        ]
+        r = tiller.Tiller('test').iter_releases(namespace="test")
+        self.assertEqual(next(r), 'foo')
+        mock_release_service_stub.return_value.ListReleases.assert_called_once()
+        self.assertEqual(list(r), ['bar', 'baz'])
+        mock_list_release_request.assert_called_with(limit=tiller.RELEASE_LIMIT, offset='bar', namespace="test", status_codes=[], filter='', sort_by=0, sort_order=0)
+
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_iter_releases_summary(self, _0, mock_release_service_stub):
+        release = Release(name='foo', namespace='test', version=3, manifest='kind: Pod')
+        release.info.status.code = 1
+        release.info.last_deployed.seconds = 10
+        release.chart.metadata.name = 'bar'
+        release.chart.metadata.version = '1.2.3'
+        mock_release_service_stub.return_value.ListReleases.return_value = [
+            ListReleasesResponse(releases=[release])
+        ]
+        r = list(tiller.Tiller('test').iter_releases(summary=True))
+        self.assertEqual(len(r), 1)
+        self.assertIsInstance(r[0], tiller.ReleaseSummary)
+        self.assertEqual((r[0].name, r[0].namespace, r[0].version, r[0].status),
+                         ('foo', 'test', 3, 'DEPLOYED'))
+        self.assertEqual((r[0].chart_name, r[0].chart_version, r[0].last_deployed),
+                         ('bar', '1.2.3', 10))
+        self.assertFalse(hasattr(r[0], '__dict__'))
+
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_list_releases_parallel(self, _0, mock_release_service_stub):
+        releases = [_release(name, namespace=namespace) for name, namespace in
+                    (('bar', 'a'), ('Baz', 'b'), ('foo', 'a'), ('1st', 'b'), ('foobar', 'b'))]
+
+        def list_releases(req, timeout, metadata):
+            matching = [r for r in releases
+                        if (not req.namespace or r.namespace == req.namespace) and
+                        re.match(req.filter, r.name)]
+            return iter([ListReleasesResponse(releases=matching)])
+
+        stub = mock_release_service_stub.return_value
+        stub.ListReleases.side_effect = list_releases
+        t = tiller.Tiller('test')
+
+        r = t.list_releases_parallel()
+        self.assertEqual([x.name for x in r], ['1st', 'Baz', 'bar', 'foo', 'foobar'])
+        self.assertEqual(stub.ListReleases.call_count, len(tiller.RELEASE_NAME_PARTITIONS))
+
+        r = t.list_releases_parallel(namespaces=['a', 'b'], summary=True)
+        self.assertEqual([x.name for x in r], ['1st', 'Baz', 'bar', 'foo', 'foobar'])
+        self.assertIsInstance(r[0], tiller.ReleaseSummary)
+
+        # Overlapping prefixes are de-duplicated
+        r = t.list_releases_parallel(prefixes=['foo', 'foob'])
+        self.assertEqual([x.name for x in r], ['foo', 'foobar'])
+
     @mock.patch('pyhelm.tiller.Tiller.list_releases')
     @mock.patch('pyhelm.tiller.grpc')
     def test_list_charts(self, _0, mock_list_releases):
@@ -89,7 +247,8 @@ class TestTiller(TestCase):
     @mock.patch('pyhelm.tiller.ReleaseServiceStub')
     @mock.patch('pyhelm.tiller.UpdateReleaseRequest')
     @mock.patch('pyhelm.tiller.grpc')
-    def test_update_release(self, _0, _1, mock_release_service_stub):
+    def test_update_release(self, _0, mock_request, mock_release_service_stub):
+        mock_request.return_value.ByteSize.return_value = 0
         mock_release_service_stub.UpdateRelease.return_value = True
         mock_release_service_stub.GetReleaseStatus.return_value = dotify(
             {'namespace': 'testing'})
@@ -97,10 +256,166 @@ class TestTiller(TestCase):
         tiller.Tiller._logger.warn.assert_called()
         self.assertTrue(t)
 
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_update_release_skip_unchanged(self, _0, mock_release_service_stub):
+        stub = mock_release_service_stub.return_value
+        deployed = _release('foo', 4)
+        deployed.chart.metadata.name = 'bar'
+        deployed.config.raw = 'b: 2\na: 1\n'
+        stub.GetReleaseContent.return_value = GetReleaseContentResponse(release=deployed)
+
+        t = tiller.Tiller('test')
+        r = t.update_release(deployed.chart, 'default', name='foo', values={'a': 1, 'b': 2},
+                             skip_unchanged=True)
+        self.assertEqual(r.release.version, 4)
+        stub.UpdateRelease.assert_not_called()
+
+        t.update_release(deployed.chart, 'default', name='foo', values={'a': 2}, skip_unchanged=True)
+        stub.UpdateRelease.assert_called_once()
+
+    @mock.patch('pyhelm.tiller.Tiller.install_release')
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.UpdateReleaseRequest')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_update_release_known_releases(self, _0, mock_request, mock_release_service_stub, mock_install_release):
+        mock_request.return_value.ByteSize.return_value = 0
+        stub = mock_release_service_stub.return_value
+        t = tiller.Tiller('test')
+
+        t.update_release('chart', 'default', name='foo', install=True, known_releases=['bar'])
+        mock_install_release.assert_called_once()
+        stub.UpdateRelease.assert_not_called()
+
+        t.update_release('chart', 'default', name='bar', install=True,
+                         known_releases=[_release('bar', namespace='other')])
+        tiller.Tiller._logger.warn.assert_called()
+        stub.UpdateRelease.assert_called_once()
+        stub.GetReleaseStatus.assert_not_called()
+
+    @mock.patch('pyhelm.tiller.Tiller.install_release')
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.UpdateReleaseRequest')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_update_release_upgrade_first(self, mock_grpc, mock_request, mock_release_service_stub, mock_install_release):
+        mock_request.return_value.ByteSize.return_value = 0
+        class NotFound(grpc.RpcError):
+            def details(self):
+                return 'UPGRADE FAILED: release: "foo" not found'
+
+        mock_grpc.RpcError = grpc.RpcError
+        stub = mock_release_service_stub.return_value
+        stub.UpdateRelease.side_effect = NotFound()
+        mock_install_release.return_value = 'installed'
+
+        r = tiller.Tiller('test').update_release('chart', '', name='foo', install=True, upgrade_first=True)
+        self.assertEqual(r, 'installed')
+        mock_install_release.assert_called_once_with('chart', 'default', False, 'foo', None, False,
+                                                     compression=None)
+        stub.GetReleaseStatus.assert_not_called()
+
+    def test_payload_report(self):
+        dependency = Chart(metadata=Metadata(name='db'),
+                           templates=[Template(name='templates/db.yaml', data=b'x' * 300)])
+        chart = Chart(metadata=Metadata(name='app'), dependencies=[dependency],
+                      templates=[Template(name='templates/app.yaml', data=b'x' * 200)],
+                      files=[Any(type_url='files/big.json', value=b'x' * 1000)])
+        request = InstallReleaseRequest(chart=chart, name='foo')
+
+        report = tiller.PayloadReport(request)
+        self.assertEqual(report.total, request.ByteSize())
+        self.assertEqual([path for path, _ in report.largest(3)],
+                         ['files/big.json', 'charts/db/templates/db.yaml', 'templates/app.yaml'])
+        self.assertEqual(report.dependencies, {'db': dependency.ByteSize()})
+        self.assertIn('charts/db/templates/db.yaml', report.format())
+
+    @mock.patch('pyhelm.tiller.GRPC_MAX_SEND_MESSAGE_LENGTH', 1024)
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_payload_too_large(self, _0, mock_release_service_stub):
+        stub = mock_release_service_stub.return_value
+        chart = Chart(templates=[Template(name='templates/big.yaml', data=b'x' * 2048)])
+        t = tiller.Tiller('test')
+
+        with self.assertRaises(tiller.PayloadTooLargeError) as raised:
+            t.install_release(chart, 'default', name='foo')
+        self.assertEqual(raised.exception.report.largest(1)[0][0], 'templates/big.yaml')
+        self.assertIn('templates/big.yaml', str(raised.exception))
+        stub.InstallRelease.assert_not_called()
+
+        self.assertRaises(tiller.PayloadTooLargeError, t.update_release_async, chart, 'default', name='foo')
+        stub.UpdateRelease.future.assert_not_called()
+
+    def test_spliced_request(self):
+        chart = Chart(metadata=Metadata(name='app'),
+                      templates=[Template(name='templates/a.yaml', data=b'x' * 300)])
+        serialized = tiller.SerializedChart(chart)
+        t = tiller.Tiller('test')
+
+        for request, expected in (
+                (t._install_request(serialized, 'default', False, 'foo', {'a': 1}, True,
+                                    False, False, False, ''),
+                 InstallReleaseRequest(chart=chart, namespace='default', name='foo',
+                                       values=Config(raw='a: 1\n'), wait=True)),
+                (t._update_request(serialized, 'foo', None, True, False, False, False,
+                                   False, False, False, 'upgrade'),
+                 UpdateReleaseRequest(chart=chart, name='foo', dry_run=True,
+                                      values=Config(raw='{}\n'), description='upgrade'))):
+            data = request.SerializeToString()
+            self.assertEqual(type(expected).FromString(data), expected)
+            self.assertEqual(request.ByteSize(), len(data))
+            self.assertEqual(request.name, 'foo')
+            self.assertEqual(request.chart, chart)
+
+        self.assertEqual(tiller.release_digest(serialized, {}), tiller.release_digest(chart, {}))
+
+    def test_release_digest(self):
+        chart = Chart(metadata=Metadata(name='foo', version='1.0.0'))
+        self.assertEqual(tiller.release_digest(chart, {'a': 1, 'b': 2}),
+                         tiller.release_digest(Chart.FromString(chart.SerializeToString()), {'b': 2, 'a': 1}))
+        self.assertNotEqual(tiller.release_digest(chart, None),
+                            tiller.release_digest(Chart(), None))
+
+    @mock.patch('pyhelm.tiller.Tiller.update_release')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_apply_many(self, _0, mock_update_release):
+        def update_release(name, **kwargs):
+            if name == 'bad':
+                raise RuntimeError('boom')
+            return name
+
+        mock_update_release.side_effect = update_release
+        specs = [{'name': 'foo', 'chart': 'c', 'namespace': 'ns'},
+                 {'name': 'bad', 'chart': 'c', 'namespace': 'ns'},
+                 {'name': 'bar', 'chart': 'c', 'namespace': 'ns', 'install': False}]
+        results = dict((r.name, r) for r in tiller.Tiller('test').apply_many(specs, max_workers=2))
+        self.assertEqual(sorted(results), ['bad', 'bar', 'foo'])
+        self.assertEqual(results['foo'].response, 'foo')
+        self.assertFalse(results['bad'].ok)
+        mock_update_release.assert_any_call(name='foo', chart='c', namespace='ns', install=True)
+        mock_update_release.assert_any_call(name='bar', chart='c', namespace='ns', install=False)
+
+    @mock.patch('pyhelm.tiller.Tiller.iter_releases')
+    @mock.patch('pyhelm.tiller.Tiller.update_release')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_apply_many_prefetch(self, _0, mock_update_release, mock_iter_releases):
+        mock_iter_releases.return_value = iter([_release('foo', namespace='ns')])
+        list(tiller.Tiller('test').apply_many([{'name': 'foo'}, {'name': 'bar'}], prefetch=True))
+        mock_iter_releases.assert_called_once_with(status_codes=tiller.ReleaseCache.STATUS_CODES, summary=True)
+        mock_update_release.assert_any_call(name='bar', install=True, known_releases={'foo': 'ns'})
+
+    @mock.patch('pyhelm.tiller.Tiller.update_release')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_apply_many_fail_fast(self, _0, mock_update_release):
+        mock_update_release.side_effect = RuntimeError('boom')
+        results = tiller.Tiller('test').apply_many([{'name': 'foo'}], fail_fast=True)
+        self.assertRaises(RuntimeError, list, results)
+
     @mock.patch('pyhelm.tiller.ReleaseServiceStub')
     @mock.patch('pyhelm.tiller.InstallReleaseRequest')
     @mock.patch('pyhelm.tiller.grpc')
-    def test_install_release(self, _0, _1, mock_release_service_stub):
+    def test_install_release(self, _0, mock_request, mock_release_service_stub):
+        mock_request.return_value.ByteSize.return_value = 0
         mock_release_service_stub.InstallRelease.return_value = True
         t = tiller.Tiller('test').install_release('foo', 'test')
         self.assertTrue(t)
@@ -112,6 +427,53 @@ class TestTiller(TestCase):
         t = tiller.Tiller('test').uninstall_release('foo')
         self.assertTrue(t)
 
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_release_async(self, _0, mock_release_service_stub):
+        stub = mock_release_service_stub.return_value
+        cache = tiller.ReleaseCache()
+        cache.invalidate = mock.Mock()
+        t = tiller.Tiller('test', timeout=30, release_cache=cache)
+
+        future = t.uninstall_release_async('foo', timeout=5)
+        self.assertIs(future, stub.UninstallRelease.future.return_value)
+        stub.UninstallRelease.future.assert_called_once_with(mock.ANY, 5, metadata=t.metadata,
+                                                                 compression=None)
+        stub.UninstallRelease.assert_not_called()
+
+        # Caches are invalidated once the call completes
+        cache.invalidate.assert_not_called()
+        callback = future.add_done_callback.call_args[0][0]
+        callback(future)
+        cache.invalidate.assert_called_once_with('foo')
+
+        t.rollback_release_async('foo', 1)
+        stub.RollbackRelease.future.assert_called_once_with(mock.ANY, 30, metadata=t.metadata,
+                                                                compression=None)
+
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_update_release_async(self, _0, mock_release_service_stub):
+        stub = mock_release_service_stub.return_value
+        deployed = _release('foo', 4)
+        deployed.config.raw = 'a: 1\n'
+        stub.GetReleaseContent.return_value = GetReleaseContentResponse(release=deployed)
+        t = tiller.Tiller('test')
+
+        future = t.update_release_async(deployed.chart, 'default', name='foo',
+                                        values={'a': 1}, skip_unchanged=True)
+        self.assertTrue(future.done())
+        self.assertEqual(future.result().release.version, 4)
+        stub.UpdateRelease.future.assert_not_called()
+
+        future = t.update_release_async(deployed.chart, 'default', name='bar', install=True,
+                                        known_releases=['foo'])
+        self.assertIs(future, stub.InstallRelease.future.return_value)
+
+        future = t.update_release_async(deployed.chart, 'default', name='foo', install=True,
+                                        known_releases=['foo'])
+        self.assertIs(future, stub.UpdateRelease.future.return_value)
+
     @mock.patch('pyhelm.tiller.ReleaseServiceStub')
     @mock.patch('pyhelm.tiller.grpc')
     def test_get_release_status(self, _0, mock_release_service_stub):
@@ -126,14 +488,214 @@ class TestTiller(TestCase):
         t = tiller.Tiller('test').get_release_content('foo')
         self.assertTrue(t)
 
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_get_history(self, _0, mock_release_service_stub):
+        mock_release_service_stub.return_value.GetHistory.return_value = True
+        t = tiller.Tiller('test').get_history('foo', max=5)
+        mock_release_service_stub.return_value.GetHistory.assert_called()
+        self.assertTrue(t)
+
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_rollback_release(self, _0, mock_release_service_stub):
+        mock_release_service_stub.return_value.RollbackRelease.return_value = True
+        t = tiller.Tiller('test').rollback_release('foo', 1)
+        self.assertTrue(t)
+
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_test_release(self, _0, mock_release_service_stub):
+        mock_release_service_stub.return_value.RunReleaseTest.return_value = iter(['running', 'passed'])
+        t = tiller.Tiller('test').test_release('foo')
+        self.assertEqual(t, ['running', 'passed'])
+
     @mock.patch('pyhelm.tiller.Tiller.uninstall_release')
-    @mock.patch('pyhelm.tiller.Tiller.list_releases')
+    @mock.patch('pyhelm.tiller.Tiller.iter_releases')
     @mock.patch('pyhelm.tiller.grpc')
     def test_chart_cleanup_no_releases(self, _0, mock_list, mock_uninstall):
-        mock_list.return_value = [dotify({'name': 'test-baz'})]
+        mock_list.return_value = iter([dotify({'name': 'test-baz'})])
         tiller.Tiller('test').chart_cleanup('test', [
             {'chart': {'release_name': 'foo'}},
             {'chart': {'release_name': 'bar'}},
         ])
         tiller.Tiller._logger.debug.assert_called()
+        mock_list.assert_called_once_with(filter='^test')
         mock_uninstall.assert_called_once_with('test-baz')
+
+
+def _release(name, version=1, namespace='default', code=1, deployed=0):
+    release = Release(name=name, version=version, namespace=namespace)
+    release.info.status.code = code
+    release.info.last_deployed.seconds = deployed
+    return release
+
+
+class TestReleaseCache(TestCase):
+
+    def setUp(self):
+        tiller.Tiller._logger = mock.Mock()
+
+    def test_full_refresh(self):
+        mock_tiller = mock.Mock()
+        mock_tiller.iter_releases.return_value = iter([
+            _release('foo', 2), _release('bar', namespace='test'),
+            _release('foo', 1), _release('baz', code=4),
+        ])
+        cache = tiller.ReleaseCache()
+        self.assertEqual([r.name for r in cache.releases(mock_tiller)], ['bar', 'foo'])
+        self.assertEqual([r.name for r in cache.releases(mock_tiller, namespace='test')], ['bar'])
+        self.assertEqual([r.name for r in cache.releases(mock_tiller, status_codes=['FAILED'])], ['baz'])
+        self.assertEqual(cache.get(mock_tiller, 'foo').version, 2)
+        mock_tiller.iter_releases.assert_called_once_with(status_codes=tiller.ReleaseCache.STATUS_CODES,
+                                                          sort_by='LAST_RELEASED', sort_order='DESC')
+
+    def test_incremental_refresh(self):
+        mock_tiller = mock.Mock()
+        mock_tiller.iter_releases.return_value = iter([_release('foo', deployed=2),
+                                                       _release('bar', deployed=2)])
+        cache = tiller.ReleaseCache(ttl=60)
+        cache.refresh(mock_tiller)
+
+        remaining = iter([_release('bar', 2, deployed=3), _release('foo', deployed=2),
+                          _release('baz', deployed=2), _release('old', deployed=1),
+                          _release('older')])
+        mock_tiller.iter_releases.return_value = remaining
+        cache.refresh(mock_tiller)
+        self.assertEqual(cache.get(mock_tiller, 'bar').version, 2)
+        # Listing went on past 'foo', which was already cached, to the
+        # releases deployed at the same time, and stopped at 'old'
+        self.assertEqual(cache.get(mock_tiller, 'baz').version, 1)
+        self.assertIsNone(cache.get(mock_tiller, 'old'))
+        self.assertEqual(next(remaining).name, 'older')
+
+    def test_stale_refresh(self):
+        mock_tiller = mock.Mock()
+        mock_tiller.iter_releases.return_value = iter([_release('foo', deployed=2),
+                                                       _release('bar', deployed=1)])
+        cache = tiller.ReleaseCache(ttl=60)
+        cache.refresh(mock_tiller)
+
+        # A write to 'bar' that created no revision keeps it cached, and
+        # fetches it again since the listing stops before it
+        cache.invalidate('bar')
+        mock_tiller.iter_releases.return_value = iter([_release('foo', deployed=2),
+                                                       _release('bar', deployed=1)])
+        mock_tiller.get_release_content.return_value.release = _release('bar', code=4)
+        self.assertEqual([r.name for r in cache.releases(mock_tiller)], ['foo'])
+        self.assertEqual(cache.get(mock_tiller, 'bar').info.status.code, 4)
+        mock_tiller.get_release_content.assert_called_once_with('bar')
+
+    def test_failed_write(self):
+        chart = Chart(metadata=Metadata(name='app', version='1.0.0'))
+        with FakeTiller() as fake:
+            t = fake.tiller(release_cache=tiller.ReleaseCache(ttl=60), retry_policy=None, timeout=5)
+            t.install_release(chart, 'default', name='a')
+            t.install_release(chart, 'default', name='b')
+            self.assertEqual([r.name for r in t.list_releases()], ['a', 'b'])
+
+            fake.fail('UpdateRelease')
+            self.assertRaises(grpc.RpcError, t.update_release, chart, 'default',
+                              name='b', values={'a': 1})
+            self.assertEqual([r.name for r in t.list_releases()], ['a', 'b'])
+
+            t.update_release(chart, 'default', name='b', values={'a': 1}, install=True)
+            self.assertEqual(t.get_release_status('b').info.status.code, 1)
+            self.assertEqual(len(fake.releases('b')), 2)
+
+    def test_covers(self):
+        cache = tiller.ReleaseCache()
+        self.assertTrue(cache.covers())
+        self.assertTrue(cache.covers(status_codes=['DEPLOYED', 'FAILED']))
+        self.assertFalse(cache.covers(status_codes=['SUPERSEDED']))
+        self.assertFalse(cache.covers(filter='^foo'))
+        self.assertFalse(cache.covers(sort_by='NAME'))
+
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_tiller_with_cache(self, _0, mock_release_service_stub):
+        stub = mock_release_service_stub.return_value
+        stub.ListReleases.return_value = [ListReleasesResponse(releases=[_release('foo', namespace='test')])]
+        t = tiller.Tiller('test', release_cache=tiller.ReleaseCache())
+
+        self.assertEqual(t.get_release_status('foo').namespace, 'test')
+        self.assertEqual([r.name for r in t.list_releases()], ['foo'])
+        stub.GetReleaseStatus.assert_not_called()
+        stub.ListReleases.assert_called_once()
+
+        t.uninstall_release('foo')
+        stub.ListReleases.return_value = []
+        self.assertEqual(t.list_releases(), [])
+        self.assertEqual(stub.ListReleases.call_count, 2)
+
+
+class TestRevisionCache(TestCase):
+
+    def test_lru_by_bytes(self):
+        foo, bar = _release('foo'), _release('bar')
+        cache = tiller.RevisionCache(max_bytes=len(foo.SerializeToString()) + len(bar.SerializeToString()))
+        cache.put(foo)
+        cache.put(bar)
+        self.assertEqual(cache.get('foo', 1), foo)
+        cache.put(_release('baz'))
+        # 'bar' was the least recently used revision
+        self.assertIsNone(cache.get('bar', 1))
+        self.assertEqual(cache.get('foo', 1), foo)
+        self.assertLessEqual(cache.size, len(foo.SerializeToString()) * 2)
+
+    def test_directory(self):
+        directory = tempfile.mkdtemp()
+        try:
+            tiller.RevisionCache(directory=directory).put(_release('foo', 3))
+            self.assertEqual(tiller.RevisionCache(directory=directory).get('foo', 3).version, 3)
+            self.assertIsNone(tiller.RevisionCache(directory=directory).get('foo', 2))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_directory_concurrent_puts(self):
+        directory = tempfile.mkdtemp()
+        try:
+            errors = []
+
+            def put():
+                try:
+                    tiller.RevisionCache(directory=directory).put(_release('foo', 3))
+                except Exception as error:
+                    errors.append(error)
+
+            threads = [threading.Thread(target=put) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(errors, [])
+            self.assertEqual(os.listdir(directory), ['foo.3.release'])
+            self.assertEqual(tiller.RevisionCache(directory=directory).get('foo', 3).version, 3)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_directory_errors(self):
+        tiller.RevisionCache._logger = mock.Mock()
+        directory = tempfile.mkdtemp()
+        cache = tiller.RevisionCache(max_bytes=0, directory=directory)
+        shutil.rmtree(directory)
+        cache.put(_release('foo', 3))
+        self.assertIsNone(cache.get('foo', 3))
+        tiller.RevisionCache._logger.warning.assert_called()
+
+    @mock.patch('pyhelm.tiller.ReleaseServiceStub')
+    @mock.patch('pyhelm.tiller.grpc')
+    def test_tiller_with_cache(self, _0, mock_release_service_stub):
+        stub = mock_release_service_stub.return_value
+        stub.GetHistory.return_value = GetHistoryResponse(releases=[_release('foo', 2), _release('foo', 1)])
+        t = tiller.Tiller('test', revision_cache=tiller.RevisionCache())
+
+        t.get_history('foo')
+        self.assertEqual(t.get_release_content('foo', 1).release.version, 1)
+        stub.GetReleaseContent.assert_not_called()
+
+        stub.GetReleaseContent.return_value = GetReleaseContentResponse(release=_release('foo', 3))
+        t.get_release_content('foo')
+        t.get_release_content('foo', 3)
+        stub.GetReleaseContent.assert_called_once()
@@ -0,0 +1,86 @@
+from unittest import TestCase, skipUnless
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import multiprocessing
+import os
+
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.metadata_pb2 import Metadata
+import pyhelm.tiller as tiller
+from pyhelm.testing import FakeTiller
+from pyhelm.workers import TillerProcessPool, worker_tiller
+
+
+def release_names(t):
+    return (os.getpid(), [release.name for release in t.list_releases()])
+
+
+def release_status(t, name):
+    return (worker_tiller() is t, t.get_release_status(name).namespace)
+
+
+def list_in_child(t, queue):
+    queue.put(release_names(t))
+
+
+def serve(queue, stop):
+    with FakeTiller() as fake:
+        fake.tiller().install_release(Chart(metadata=Metadata(name='app')), 'default',
+                                      name='foo')
+        queue.put(fake.port)
+        stop.wait()
+
+
+class TestWorkers(TestCase):
+
+    def setUp(self):
+        tiller.Tiller._logger = mock.Mock()
+        # The fake is served by another process, so that forking the test
+        # process doesn't fork a gRPC server
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        self.stop = context.Event()
+        self.server = context.Process(target=serve, args=(queue, self.stop))
+        self.server.start()
+        self.port = queue.get(timeout=30)
+
+    def tearDown(self):
+        self.stop.set()
+        self.server.join(10)
+
+    def tiller(self):
+        return tiller.Tiller('localhost', port=self.port)
+
+    @skipUnless(tiller.fork_supported(), "grpcio can't reconnect after fork")
+    def test_reconnect_after_fork(self):
+        t = self.tiller()
+        parent_channel = t._channel
+        self.assertEqual(release_names(t)[1], ['foo'])
+
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        child = context.Process(target=list_in_child, args=(t, queue))
+        child.start()
+        pid, names = queue.get(timeout=10)
+        child.join()
+
+        self.assertEqual(pid, child.pid)
+        self.assertEqual(names, ['foo'])
+        self.assertIs(t._channel, parent_channel)
+
+    def test_reconnect_in_process(self):
+        t = self.tiller()
+        channel = t._channel
+        with mock.patch('pyhelm.tiller.os.getpid', return_value=-1):
+            self.assertIsNot(t._channel, channel)
+            self.assertEqual(release_names(t)[1], ['foo'])
+
+    def test_process_pool(self):
+        with TillerProcessPool('localhost', processes=2, port=self.port) as pool:
+            self.assertEqual(pool.apply(release_status, 'foo'), (True, 'default'))
+            self.assertEqual(pool.apply_async(release_names).get(timeout=10)[1], ['foo'])
+            self.assertEqual(pool.map(release_status, [('foo',)] * 4), [(True, 'default')] * 4)
+            self.assertNotEqual(pool.apply(release_names)[0], os.getpid())